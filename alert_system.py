@@ -12,9 +12,8 @@ ALERT_LIMIT = 5
 CONFIDENCE_THRESHOLD = 0.9
 ALLOWED_THREAT_CLASSES = []  # Empty list means no filtering — allow all threat types
 
-# Function to send alert emails when a threat is detected
-# SMTP will be loaded from environment variables
-def send_alert(threat_data):
+# Sends one alert email; SMTP settings are loaded from environment variables
+def _deliver(subject, body):
     # Load SMTP and email config from environment
     smtp_server = os.getenv('SMTP_SERVER')
     smtp_port = os.getenv('SMTP_PORT')
@@ -27,17 +26,8 @@ def send_alert(threat_data):
     if not all([smtp_server, smtp_port, smtp_username, smtp_password, email_from, email_to]):
         raise ValueError("Missing one or more required environment variables. Please check your .env file.")
 
-    # Format the alert message
-    msg = MIMEText(
-        f" THREAT DETECTED \n\n"
-        f"Source: {threat_data['source']}\n"
-        f"Confidence: {threat_data['confidence']:.2f}\n"
-        f"Threat Type: {threat_data['threat_class'].upper()}\n"
-        f"Content Preview: {threat_data['text'][:200]}...\n\n"
-        f"View full details: {threat_data['url']}"
-    )
-
-    msg['Subject'] = f"[ALERT] {threat_data['threat_class'].upper()} threat detected"
+    msg = MIMEText(body)
+    msg['Subject'] = subject
     msg['From'] = email_from
     msg['To'] = email_to
 
@@ -51,7 +41,37 @@ def send_alert(threat_data):
     except Exception as e:
         print(f"[!] Failed to send alert: {e}")
 
-def monitor_threats(analyzed_data):
+# Function to send alert emails when a threat is detected
+def send_alert(threat_data):
+    # Format the alert message
+    _deliver(
+        f"[ALERT] {threat_data['threat_class'].upper()} threat detected",
+        f" THREAT DETECTED \n\n"
+        f"Source: {threat_data['source']}\n"
+        f"Confidence: {threat_data['confidence']:.2f}\n"
+        f"Threat Type: {threat_data['threat_class'].upper()}\n"
+        f"Content Preview: {threat_data['text'][:200]}...\n\n"
+        f"View full details: {threat_data['url']}"
+    )
+
+# Volume spike found by threat_stats.ThreatStats.update()
+def send_spike_alert(spike):
+    _deliver(
+        f"[ALERT] Volume spike: {spike['dimension']} {spike['key']}",
+        f" VOLUME SPIKE \n\n"
+        f"{spike['dimension'].title()}: {spike['key']}\n"
+        f"Items in bucket starting {spike['bucket_start']}: {spike['count']}\n"
+        f"Baseline: {spike['baseline']} (alert threshold {spike['threshold']})"
+    )
+
+def monitor_threats(analyzed_data, stats=None):
+    """
+    Alerts on confident threats and, if stats (threat_stats.ThreatStats)
+    is given, feeds it the batch and alerts on any volume spikes.
+    """
     for item in analyzed_data:
         if item.get('is_threat') and item.get('confidence', 0) > 0.7:
             send_alert(item)
+    if stats is not None:
+        for spike in stats.update(analyzed_data):
+            send_spike_alert(spike)
@@ -0,0 +1,938 @@
+# benchmark.py
+# Reproducible throughput / memory benchmarks for every pipeline stage.
+#
+# Items are produced by a seeded synthetic crawl generator that draws its
+# vocabulary from Cybersecurity_Dataset.csv, and every external service
+# (SMTP, PostgreSQL) is swapped for a local stand-in while the stages run.
+# Results are written as JSON so two commits can be diffed:
+#
+#   python benchmark.py --sizes 1000,100000,1000000
+#   python benchmark.py --compare benchmark_results/abc123.json benchmark_results/def456.json
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+DATASET_PATH = "Cybersecurity_Dataset.csv"
+RESULTS_DIR = "benchmark_results"
+FIXTURES_DIR = "benchmark_fixtures"
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_SEED = 42
+# Memory is traced on a capped sample in a second pass so tracemalloc
+# overhead never leaks into the throughput numbers.
+MEMORY_SAMPLE = 10_000
+
+SOURCES = ["rss", "security_forum", "darkweb_forum", "misp"]
+FILLER_WORDS = [
+    "new", "reported", "seen", "targeting", "via", "using", "against",
+    "customers", "servers", "users", "campaign", "observed", "in", "the", "wild",
+]
+FORUM_HOSTS = ["security.stackexchange.com", "threatpost.com", "exampleforum.onion"]
+
+# ---------------------------------------------------------------------------
+# Synthetic crawl generator
+# ---------------------------------------------------------------------------
+
+def load_vocabulary(path=DATASET_PATH):
+    """
+    Builds the word pools used by the synthetic generator from the dataset.
+
+    Args:
+        path (str): Path to the Kaggle CSV.
+
+    Returns:
+        dict: Pools keyed by 'descriptions', 'keywords', 'entities',
+              'actors', 'iocs', 'categories' and 'vectors'.
+    """
+    from data_loader import literal_list_values
+
+    df = pd.read_csv(path)
+    vocab = {
+        "descriptions": sorted(df["Cleaned Threat Description"].dropna().astype(str).unique()),
+        "actors": sorted(df["Threat Actor"].dropna().astype(str).unique()),
+        "categories": sorted(df["Threat Category"].dropna().astype(str).unique()),
+        "vectors": sorted(df["Attack Vector"].dropna().astype(str).unique()),
+    }
+    for key, column in [("keywords", "Keyword Extraction"),
+                        ("entities", "Named Entities (NER)"),
+                        ("iocs", "IOCs (Indicators of Compromise)")]:
+        vocab[key] = literal_list_values(df[column])
+    return vocab
+
+
+def iter_synthetic_items(n, seed=DEFAULT_SEED, vocab=None):
+    """
+    Yields ``n`` raw items shaped like the output of data_collector.
+
+    The same seed always yields the same items, so runs on different
+    commits benchmark identical inputs.
+    """
+    vocab = vocab or load_vocabulary()
+    rng = random.Random(seed)
+    base_time = datetime(2025, 1, 1)
+    for i in range(n):
+        words = rng.choice(vocab["descriptions"]).split()
+        for _ in range(rng.randint(2, 8)):
+            pool = rng.choice(["keywords", "entities", "actors", "categories", "vectors"])
+            words.insert(rng.randint(0, len(words)), rng.choice(vocab[pool]))
+        words.extend(rng.sample(FILLER_WORDS, rng.randint(1, 4)))
+        if rng.random() < 0.3:
+            words.append(rng.choice(vocab["iocs"]))
+        if rng.random() < 0.2:
+            words.append(f"https://{rng.choice(FORUM_HOSTS)}/t/{rng.randint(1, 10**6)}")
+        if rng.random() < 0.1:
+            words.append(f"@{rng.choice(vocab['actors']).replace(' ', '')}")
+        host = rng.choice(FORUM_HOSTS)
+        yield {
+            "source": rng.choice(SOURCES),
+            "text": " ".join(words),
+            "url": f"https://{host}/questions/{i}",
+            "timestamp": (base_time + timedelta(seconds=i)).isoformat(),
+        }
+
+
+def generate_synthetic_items(n, seed=DEFAULT_SEED, vocab=None):
+    return list(iter_synthetic_items(n, seed=seed, vocab=vocab))
+
+def render_forum_page(items, seed=DEFAULT_SEED):
+    """
+    Renders items as a forum listing page in the old security.stackexchange
+    markup (.question-summary blocks), wrapped in the navigation, sidebar
+    and script boilerplate that makes real pages expensive to parse.
+    """
+    rng = random.Random(seed)
+    nav = "".join(f'<li><a href="/nav/{i}" class="nav-link">Section {i}</a></li>' for i in range(40))
+    sidebar = "".join(
+        f'<div class="hot-question"><a href="/q/{rng.randint(1, 10**6)}">{item["text"][:60]}</a>'
+        f'<span class="site-icon" title="site {i}"></span></div>'
+        for i, item in enumerate(items * 2))
+    script = "var config = {" + ",".join(f'"k{i}": {i}' for i in range(500)) + "};"
+    summaries = []
+    for i, item in enumerate(items):
+        tags = "".join(f'<a href="/tags/{t}" class="post-tag">{t}</a>'
+                       for t in rng.sample(item["text"].split(), min(3, len(item["text"].split()))))
+        summaries.append(
+            f'<div class="question-summary" id="question-summary-{i}">'
+            f'<div class="statscontainer"><div class="votes"><span class="vote-count-post">'
+            f'<strong>{rng.randint(0, 50)}</strong></span> votes</div>'
+            f'<div class="status answered"><strong>{rng.randint(0, 9)}</strong> answers</div>'
+            f'<div class="views">{rng.randint(10, 5000)} views</div></div>'
+            f'<div class="summary"><h3><a href="/questions/{i}/q" class="question-hyperlink">'
+            f'{item["text"]}</a></h3><div class="excerpt">{item["text"] * 2}</div>'
+            f'<div class="tags">{tags}</div><div class="started">'
+            f'<span title="{item["timestamp"]}Z" class="relativetime">{i} mins ago</span>'
+            f'<div class="user-details"><a href="/users/{i}">user{i}</a>'
+            f'<span class="reputation-score">{rng.randint(1, 10**5)}</span></div></div></div></div>')
+    return (
+        f'<!DOCTYPE html><html><head><title>Newest Questions</title><script>{script}</script>'
+        f'<link rel="stylesheet" href="/all.css"></head><body><header><ul>{nav}</ul></header>'
+        f'<div id="content"><div id="mainbar"><div id="questions">{"".join(summaries)}</div></div>'
+        f'<div id="sidebar">{sidebar}</div></div><footer>{nav}</footer></body></html>'
+    )
+
+
+def write_html_fixtures(pages=20, per_page=50, seed=DEFAULT_SEED, directory=FIXTURES_DIR):
+    """Writes seeded forum pages to directory (once) and returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    vocab = load_vocabulary()
+    paths = []
+    for page in range(pages):
+        path = os.path.join(directory, f"forum_{seed}_{page:03d}.html")
+        if not os.path.exists(path):
+            items = generate_synthetic_items(per_page, seed=seed + page, vocab=vocab)
+            with open(path, "w") as f:
+                f.write(render_forum_page(items, seed=seed + page))
+        paths.append(path)
+    return paths
+
+# ---------------------------------------------------------------------------
+# Local stand-ins for external services
+# ---------------------------------------------------------------------------
+
+class LocalSMTP:
+    """Drop-in for smtplib.SMTP that only counts messages."""
+    sent = 0
+
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        self.host = host
+        self.port = port
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def send_message(self, msg):
+        LocalSMTP.sent += 1
+
+
+class LocalCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = []
+
+    def execute(self, query, params=None):
+        self.connection.rows_written += 1
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class LocalDBConnection:
+    """Drop-in for a psycopg2 connection that accepts and discards writes."""
+
+    def __init__(self):
+        self.rows_written = 0
+
+    def cursor(self):
+        return LocalCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@contextlib.contextmanager
+def local_services():
+    """
+    Routes alert_system and db_handler to the local stand-ins for the
+    duration of the block and silences their per-item console output.
+    """
+    import alert_system
+    import db_handler
+
+    env = {
+        "SMTP_SERVER": "localhost", "SMTP_PORT": "1025",
+        "SMTP_USERNAME": "bench", "SMTP_PASSWORD": "bench",
+        "ALERT_EMAIL_FROM": "bench@localhost", "ALERT_EMAIL_TO": "soc@localhost",
+    }
+    saved_env = {key: os.environ.get(key) for key in env}
+    saved_smtp = alert_system.smtplib.SMTP
+    saved_conn = db_handler.get_db_connection
+    os.environ.update(env)
+    alert_system.smtplib.SMTP = LocalSMTP
+    db_handler.get_db_connection = LocalDBConnection
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        alert_system.smtplib.SMTP = saved_smtp
+        db_handler.get_db_connection = saved_conn
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+# name -> (prepare, run). ``prepare(items)`` builds the stage input outside
+# the timed region; ``run(payload)`` is what gets timed.
+STAGES = {}
+
+
+def register_stage(name, prepare=None):
+    def decorator(run):
+        STAGES[name] = (prepare or (lambda items: items), run)
+        return run
+    return decorator
+
+
+def _clean_texts(items):
+    from data_processor import preprocess_text
+    return [preprocess_text(item["text"]) for item in items]
+
+
+def _feature_matrix(items):
+    import threat_detector
+    threat_detector.load_model_artifacts()
+    return threat_detector.vectorizer_model.transform(_clean_texts(items))
+
+
+def _analyzed(items):
+    import threat_detector
+    from data_processor import preprocess_text
+    threat_detector.load_model_artifacts()
+    clean = [preprocess_text(item["text"]) for item in items]
+    proba = threat_detector.classifier_model.predict_proba(
+        threat_detector.vectorizer_model.transform(clean))[:, 1]
+    return [{
+        **item,
+        "clean_text": text,
+        "entities": {"orgs": [], "tech": [], "threats": []},
+        "is_threat": bool(p > 0.5),
+        "confidence": float(max(p, 1 - p)),
+        "threat_class": "critical" if p > 0.7 else "suspicious" if p > 0.5 else "benign",
+    } for item, text, p in zip(items, clean, proba)]
+
+
+@register_stage("preprocess")
+def _run_preprocess(items):
+    from data_processor import preprocess_text
+    for item in items:
+        preprocess_text(item["text"])
+
+
+@register_stage("normalize")
+def _run_normalize(items):
+    from data_processor import normalize_text
+    for item in items:
+        normalize_text(item["text"])
+
+
+def _token_lists(items):
+    from data_processor import normalize_text
+    return [normalize_text(item["text"])[1] for item in items]
+
+
+@register_stage("ner", prepare=_clean_texts)
+def _run_ner(clean_texts):
+    from data_processor import extract_entities
+    for text in clean_texts:
+        extract_entities(text)
+
+
+@register_stage("vectorize", prepare=_clean_texts)
+def _run_vectorize(clean_texts):
+    import threat_detector
+    threat_detector.load_model_artifacts()
+    threat_detector.vectorizer_model.transform(clean_texts)
+
+
+@register_stage("vectorize_tokens", prepare=_token_lists)
+def _run_vectorize_tokens(token_lists):
+    import threat_detector
+    threat_detector.load_model_artifacts()
+    threat_detector.get_token_vectorizer().transform(token_lists)
+
+
+@register_stage("classify", prepare=_feature_matrix)
+def _run_classify(X):
+    import threat_detector
+    threat_detector.classifier_model.predict_proba(X)
+
+
+@register_stage("classify_heads", prepare=_feature_matrix)
+def _run_classify_heads(X):
+    import threat_detector
+    threat_detector.classifier_model.predict_proba(X)
+    for head in (threat_detector.load_head_models() or {}).values():
+        head.predict_proba(X)
+
+
+@register_stage("alert", prepare=_analyzed)
+def _run_alert(analyzed):
+    from alert_system import monitor_threats
+    with local_services():
+        monitor_threats(analyzed)
+
+
+@register_stage("store", prepare=_analyzed)
+def _run_store(analyzed):
+    from db_handler import save_threats
+    with local_services():
+        save_threats(analyzed)
+
+
+@register_stage("end_to_end")
+def _run_end_to_end(items):
+    # Mirrors main.run_pipeline after collection (in-process, no IOC index),
+    # plus persistence. Rolling stats and the change log go to a scratch dir.
+    import tempfile
+    from data_processor import process_data
+    from threat_detector import analyze_data
+    from alert_system import monitor_threats
+    from db_handler import save_threats
+    from change_log import publish_threats
+    from threat_stats import ThreatStats
+    with local_services(), tempfile.TemporaryDirectory() as scratch:
+        analyzed = analyze_data(process_data(items))
+        stats = ThreatStats()
+        monitor_threats(analyzed, stats=stats)
+        stats.save(os.path.join(scratch, "threat_stats_state.json"), os.path.join(scratch, "threat_stats.json"))
+        publish_threats(analyzed, path=os.path.join(scratch, "threat_changes.jsonl"))
+        save_threats(analyzed)
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def _measure(name, items):
+    prepare, run = STAGES[name]
+    payload = prepare(items)
+    start = time.perf_counter()
+    run(payload)
+    seconds = time.perf_counter() - start
+
+    sample = items[:MEMORY_SAMPLE]
+    payload = prepare(sample)
+    tracemalloc.start()
+    try:
+        run(payload)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "stage": name,
+        "size": len(items),
+        "seconds": round(seconds, 6),
+        "items_per_sec": round(len(items) / seconds, 2) if seconds > 0 else None,
+        "peak_bytes": peak,
+        "bytes_per_item": round(peak / len(sample), 2) if sample else None,
+        "memory_sample": len(sample),
+    }
+
+
+def compare_text_paths(path=DATASET_PATH):
+    """
+    Per-item cost on the dataset of the string path (preprocess_text,
+    keyword split, vectorizer on the string) against the cached-token path
+    (normalize_text, keywords and vectorizer on the same token list).
+    NER is identical on both paths and left out.
+    """
+    import threat_detector
+    from data_processor import THREAT_KEYWORDS, normalize_text, preprocess_text
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threat_detector.load_model_artifacts()
+    texts = pd.read_csv(path)["Cleaned Threat Description"].astype(str).tolist()
+    vectorizer = threat_detector.vectorizer_model
+    token_vectorizer = threat_detector.get_token_vectorizer()
+
+    def string_path():
+        for text in texts:
+            clean = preprocess_text(text)
+            [w for w in clean.split() if w in THREAT_KEYWORDS]
+            vectorizer.transform([clean])
+
+    def token_path():
+        for text in texts:
+            clean, tokens = normalize_text(text)
+            [w for w in tokens if w in THREAT_KEYWORDS]
+            token_vectorizer.transform([tokens])
+
+    timings = {}
+    for name, fn in [("string", string_path), ("tokens", token_path)]:
+        fn()  # warm up
+        start = time.perf_counter()
+        fn()
+        timings[name] = (time.perf_counter() - start) / len(texts) * 1e6
+    saving = timings["string"] - timings["tokens"]
+    print(f"string path: {timings['string']:.1f} us/item")
+    print(f"token path:  {timings['tokens']:.1f} us/item")
+    print(f"saving:      {saving:.1f} us/item ({saving / timings['string']:.0%})")
+    return timings
+
+
+def compare_head_cost(size=10_000, seed=DEFAULT_SEED):
+    """
+    Marginal per-item cost of each multi-head classifier on top of the
+    binary one when all share one TF-IDF matrix, against the cost of
+    re-vectorizing the batch for every head.
+    """
+    import threat_detector
+    from data_processor import normalize_text
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threat_detector.load_model_artifacts()
+        heads = threat_detector.load_head_models()
+    if not heads:
+        print(f"No head models found at {threat_detector.HEADS_PATH}; run train_model.py first.")
+        return None
+
+    token_lists = [normalize_text(item["text"])[1]
+                   for item in generate_synthetic_items(size, seed=seed)]
+
+    def per_item(fn):
+        start = time.perf_counter()
+        fn()
+        return (time.perf_counter() - start) / size * 1e6
+
+    vectorize_us = per_item(lambda: threat_detector.vectorize_batch(None, token_lists))
+    X = threat_detector.vectorize_batch(None, token_lists)
+    binary_us = per_item(lambda: threat_detector.classifier_model.predict_proba(X))
+    head_us = {name: per_item(lambda head=head: head.predict_proba(X)) for name, head in heads.items()}
+
+    shared = vectorize_us + binary_us + sum(head_us.values())
+    revectorized = shared + vectorize_us * len(heads)
+    rows = [("vectorize (once)", vectorize_us), ("binary classifier", binary_us)]
+    rows += [(f"+ {name} head", us) for name, us in head_us.items()]
+    rows += [("shared matrix total", shared), ("re-vectorize per head", revectorized)]
+    for label, us in rows:
+        print(f"{label + ':':<24}{us:8.1f} us/item")
+    return {"vectorize": vectorize_us, "binary": binary_us, "heads": head_us}
+
+
+def compare_parsers(pages=20):
+    """
+    Parse time per saved forum page: the original full html.parser tree +
+    select() against html_extractor with each available backend, plus the
+    cost of a recrawl where every page is unchanged.
+    """
+    from bs4 import BeautifulSoup
+    from html_extractor import DEFAULT_PARSER, SITE_CONFIGS, get_extractor
+    from tor_crawler import FingerprintStore
+
+    html_pages = []
+    for path in write_html_fixtures(pages):
+        with open(path) as f:
+            html_pages.append(f.read())
+    base = "https://security.stackexchange.com"
+
+    def full_tree(html):
+        soup = BeautifulSoup(html, "html.parser")
+        return [{
+            "text": q.select_one(".question-hyperlink").text,
+            "timestamp": q.select_one(".relativetime")["title"],
+            "url": base + q.select_one(".question-hyperlink")["href"],
+        } for q in soup.select(".question-summary")[:20]]
+
+    def per_page(fn):
+        start = time.perf_counter()
+        for i, html in enumerate(html_pages):
+            fn(i, html)
+        return (time.perf_counter() - start) / len(html_pages) * 1e3
+
+    expected = [full_tree(html) for html in html_pages]
+    rows = [("full tree, html.parser", per_page(lambda i, html: full_tree(html)))]
+    for parser in sorted({"html.parser", DEFAULT_PARSER}):
+        extractor = get_extractor("security_stackexchange", parser)
+        got = [[{k: item[k] for k in ("text", "timestamp", "url")} for item in extractor.extract(html)]
+               for html in html_pages]
+        if got != expected:
+            print(f"WARNING: {parser} extractor output differs from the full-tree parse")
+        rows.append((f"strained, {parser}", per_page(lambda i, html: extractor.extract(html))))
+
+    store = FingerprintStore(path=None)
+    extractor = get_extractor("security_stackexchange")
+    per_page(lambda i, html: extractor.extract(html, url=f"page{i}", fingerprints=store))
+    rows.append(("unchanged posts skip", per_page(
+        lambda i, html: extractor.extract(html, url=f"page{i}", fingerprints=store))))
+
+    size_kb = sum(len(html) for html in html_pages) / len(html_pages) / 1024
+    print(f"{len(html_pages)} pages, {size_kb:.0f} KiB each, {SITE_CONFIGS['security_stackexchange']['limit']} items kept")
+    for label, ms in rows:
+        print(f"{label + ':':<26}{ms:8.2f} ms/page")
+    return dict(rows)
+
+
+def compare_ioc_screen(size=1_000_000, probes=200_000, seed=DEFAULT_SEED):
+    """
+    Builds an IOC index from the dataset's IOC column plus ``size`` synthetic
+    feed indicators, then reports the Bloom filter's false-positive rate,
+    bytes per indicator, and per-token lookup cost against a Python set,
+    one token at a time and for the whole batch at once (as match_batch).
+    """
+    import tempfile
+    import numpy as np
+    from data_loader import load_dataset_iocs
+    from threat_intel import IOCIndex
+
+    rng = random.Random(seed)
+    indicators = load_dataset_iocs() + [
+        f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+        if i % 2 else f"{rng.getrandbits(256):064x}" for i in range(size)]
+    # Crawled tokens are overwhelmingly unknown: 1% known, 99% fresh
+    tokens = [rng.choice(indicators) if i % 100 == 0 else f"unseen-{i}.example.org" for i in range(probes)]
+
+    tracemalloc.start()
+    exact = set(indicators)
+    set_bytes = tracemalloc.get_traced_memory()[0] + sum(sys.getsizeof(i) for i in exact)
+    tracemalloc.stop()
+
+    index = IOCIndex()
+    index.update(indicators)
+    path = os.path.join(tempfile.mkdtemp(), "ioc_index.npy")
+    index.save(path)
+    screened = IOCIndex.load(path)  # memory-mapped sorted hashes + Bloom filter
+    bloom = screened.bloom
+
+    absent = np.frombuffer(os.urandom(8 * probes), dtype=np.uint64)
+    fp_rate = float(bloom.might_contain_keys(absent).mean())
+    no_false_negatives = bool(bloom.might_contain_keys(np.asarray(screened._sorted)).all())
+
+    def per_lookup(fn):
+        start = time.perf_counter()
+        hits = sum(1 for token in tokens if fn(token))
+        return (time.perf_counter() - start) / len(tokens) * 1e6, hits
+
+    set_us, set_hits = per_lookup(exact.__contains__)
+    screen_us, screen_hits = per_lookup(screened.__contains__)
+    start = time.perf_counter()
+    batch_hits = int(screened.contains_keys(IOCIndex.keys(tokens)).sum())
+    batch_us = (time.perf_counter() - start) / len(tokens) * 1e6
+    keys = [IOCIndex.key(token) for token in tokens]
+    start = time.perf_counter()
+    candidates = sum(1 for key in keys if bloom.might_contain_key(key))
+    screen_only_us = (time.perf_counter() - start) / len(keys) * 1e6
+
+    n = len(screened)
+    print(f"{n} indicators, k={bloom.num_hashes}, {bloom.num_blocks} blocks")
+    print(f"false-positive rate:  {fp_rate:.4%} measured, {bloom.expected_fp_rate():.4%} expected")
+    print(f"no false negatives:   {no_false_negatives}")
+    print(f"Bloom filter:         {bloom.nbytes / n:6.2f} bytes/indicator (mmap)")
+    print(f"sorted hash array:    {screened._sorted.nbytes / n:6.2f} bytes/indicator (mmap)")
+    print(f"Python set of str:    {set_bytes / n:6.2f} bytes/indicator (heap, incl. strings)")
+    print(f"set lookup:           {set_us:6.2f} us/token ({set_hits} hits)")
+    print(f"screen + confirm:     {screen_us:6.2f} us/token ({screen_hits} hits, incl. hashing)")
+    print(f"  batched:            {batch_us:6.2f} us/token ({batch_hits} hits, incl. hashing)")
+    print(f"screen only:          {screen_only_us:6.2f} us/token ({candidates} candidates)")
+    return {"fp_rate": fp_rate, "bloom_bytes_per_indicator": bloom.nbytes / n,
+            "set_us_per_token": set_us, "batch_us_per_token": batch_us}
+
+
+def compare_sharding(size=20_000, worker_counts=None, seed=DEFAULT_SEED):
+    """
+    process_data + analyze_data throughput in-process against
+    sharded_pipeline with increasing worker counts. Worker start-up
+    (spawning and loading spaCy and the models) is included.
+    """
+    from data_processor import process_data
+    from sharded_pipeline import run_sharded
+    from threat_detector import analyze_data
+
+    cores = os.cpu_count() or 1
+    worker_counts = worker_counts or sorted({1, 2, 4, cores})
+    items = generate_synthetic_items(size, seed=seed)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        analyze_data(process_data(items))
+        inline = time.perf_counter() - start
+    print(f"{cores} cores, {size} items")
+    print(f"{'in-process:':<16}{size / inline:10.1f} items/s")
+    results = {"in_process": size / inline}
+    for workers in worker_counts:
+        start = time.perf_counter()
+        run_sharded(items, workers=workers)
+        seconds = time.perf_counter() - start
+        results[workers] = size / seconds
+        print(f"{f'{workers} workers:':<16}{size / seconds:10.1f} items/s  "
+              f"{inline / seconds:5.2f}x in-process")
+    return results
+
+
+def _echo_pickled(task_queue, result_queue):
+    # Receives pickled CSR batches and reports their nnz
+    while (matrix := task_queue.get()) is not None:
+        result_queue.put(matrix.nnz)
+
+
+def _echo_shared(task_queue, result_queue):
+    # Maps SharedCSRPool handles and reports their nnz
+    from shared_features import SharedCSRReader
+
+    reader = SharedCSRReader()
+    while (task := task_queue.get()) is not None:
+        slot, handle = task
+        result_queue.put((slot, reader.read(handle).nnz))
+    reader.close()
+
+
+def compare_feature_transport(batch_sizes=(256, 4096), batches=50, seed=DEFAULT_SEED):
+    """
+    Bytes pushed through the queue pipe and round-trip latency per feature
+    batch sent to another process pickled vs as a SharedCSRPool handle, plus
+    the size of each scoring process's model copy pickled vs shared.
+    """
+    import multiprocessing as mp
+    import pickle
+    import threat_detector
+    from shared_features import SharedCSRPool, share_models
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threat_detector.load_model_artifacts()
+        heads = threat_detector.load_head_models()
+    ctx = mp.get_context("spawn")
+    results = {}
+    for batch_size in batch_sizes:
+        items = generate_synthetic_items(batch_size, seed=seed)
+        X = threat_detector.vectorize_batch([item["text"] for item in items])
+        row = {}
+        for name, target in (("pickle", _echo_pickled), ("shared", _echo_shared)):
+            pool = SharedCSRPool() if name == "shared" else None
+            tasks, replies = ctx.Queue(), ctx.Queue()
+            worker = ctx.Process(target=target, args=(tasks, replies))
+            worker.start()
+            timings, sent = [], 0
+            for i in range(batches + 1):
+                start = time.perf_counter()
+                message = pool.put(X) if pool else X
+                tasks.put(message)
+                reply = replies.get()
+                if pool:
+                    pool.release(reply[0])
+                if i:  # the first batch includes worker start-up
+                    timings.append(time.perf_counter() - start)
+                    sent += len(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+            tasks.put(None)
+            worker.join()
+            if pool:
+                pool.unlink()
+            row[name] = {"bytes": sent / batches, "ms": 1000 * sum(timings) / batches}
+        results[batch_size] = row
+        print(f"batch of {batch_size} ({X.nnz} nnz, {X.data.nbytes + X.indices.nbytes + X.indptr.nbytes} B of arrays):")
+        for name, r in row.items():
+            print(f"  {name:<8}{r['bytes']:10.0f} B through the pipe  {r['ms']:7.3f} ms round trip")
+
+    models = share_models(threat_detector.classifier_model, heads)
+    pickled = len(pickle.dumps(threat_detector.classifier_model, pickle.HIGHEST_PROTOCOL)) + sum(
+        len(pickle.dumps(head, pickle.HIGHEST_PROTOCOL)) for head in heads.values())
+    shared = sum(m.arrays.nbytes for m in models.values())
+    handles = len(pickle.dumps({n: m.handle for n, m in models.items()}, pickle.HIGHEST_PROTOCOL))
+    print(f"models: {pickled} B pickled per process, {shared} B shared once, {handles} B of handles")
+    for model in models.values():
+        model.unlink()
+    results["models"] = {"pickled_bytes": pickled, "shared_bytes": shared, "handle_bytes": handles}
+    return results
+
+
+def compare_triage(size=10_000, singles=300, seed=DEFAULT_SEED):
+    """
+    Forest-only vs two-tier (distilled linear + escalation) scoring for
+    threat_detector's classifier and the 200-tree improved_classifier:
+    batch throughput, single-item latency, escalation rate and agreement
+    with the forest on the dataset and on synthetic items.
+    """
+    import joblib
+    import numpy as np
+    import threat_detector
+    from data_loader import load_threat_dataset
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threat_detector.load_model_artifacts()
+        student = threat_detector.load_distilled_model()
+        dataset = load_threat_dataset()["text"].tolist()
+    if student is None:
+        print("distilled model missing: run train_model.train_and_save_distilled() first")
+        return None
+    synthetic = [item["text"] for item in generate_synthetic_items(size, seed=seed)]
+    improved_vectorizer = joblib.load("improved_vectorizer.joblib")
+    improved_forest = joblib.load("improved_classifier.joblib")
+    models = {
+        "threat_classifier": (threat_detector.vectorizer_model, threat_detector.classifier_model, student),
+        "improved_classifier": (improved_vectorizer, improved_forest,
+                                threat_detector.distill_forest(improved_vectorizer, improved_forest, dataset)),
+    }
+
+    def threat_class(p):
+        return np.where(p > 0.7, 2, np.where(p > 0.5, 1, 0))
+
+    results = {}
+    for model_name, (vectorizer, forest, linear) in models.items():
+        print(f"{model_name} ({len(forest.estimators_)} trees, "
+              f"{np.count_nonzero(linear.coef_)}/{linear.coef_.size} non-zero weights):")
+        for corpus_name, texts in (("dataset", dataset), ("synthetic", synthetic)):
+            X = vectorizer.transform(texts)
+            start = time.perf_counter()
+            forest_p = forest.predict_proba(X)[:, 1]
+            forest_s = time.perf_counter() - start
+            start = time.perf_counter()
+            tier_p, escalated = threat_detector.triage_proba(linear, forest, X)
+            tier_s = time.perf_counter() - start
+            row = {
+                "forest_items_per_s": len(texts) / forest_s,
+                "two_tier_items_per_s": len(texts) / tier_s,
+                "escalation_rate": float(escalated.mean()),
+                "agreement": float(((forest_p > 0.5) == (tier_p > 0.5)).mean()),
+                "class_agreement": float((threat_class(forest_p) == threat_class(tier_p)).mean()),
+                "linear_only_agreement": float(
+                    ((forest_p > 0.5) == (threat_detector.distilled_proba(linear, X) > 0.5)).mean()),
+            }
+            results[f"{model_name}/{corpus_name}"] = row
+            print(f"  {corpus_name:<10}{row['forest_items_per_s']:10.0f} vs {row['two_tier_items_per_s']:10.0f} items/s, "
+                  f"escalated {row['escalation_rate']:.1%}, agreement {row['agreement']:.3f} "
+                  f"(threat_class {row['class_agreement']:.3f}, linear alone {row['linear_only_agreement']:.3f})")
+
+        # predict_threat scores one text at a time, where the forest's
+        # per-call overhead dominates
+        X = vectorizer.transform(synthetic[:singles])
+        start = time.perf_counter()
+        for i in range(singles):
+            forest.predict_proba(X[i])
+        forest_ms = (time.perf_counter() - start) / singles * 1000
+        start = time.perf_counter()
+        for i in range(singles):
+            threat_detector.triage_proba(linear, forest, X[i])
+        tier_ms = (time.perf_counter() - start) / singles * 1000
+        results[f"{model_name}/single_item_ms"] = {"forest": forest_ms, "two_tier": tier_ms}
+        print(f"  single item: {forest_ms:.3f} ms forest, {tier_ms:.3f} ms two-tier")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(sizes=None, stages=None, seed=DEFAULT_SEED):
+    """
+    Runs each selected stage at each size and returns the results document.
+
+    A stage whose dependencies are unavailable (e.g. no spaCy model
+    installed) is recorded as skipped instead of aborting the run.
+    """
+    sizes = sizes or DEFAULT_SIZES
+    stages = stages or list(STAGES)
+    vocab = load_vocabulary()
+    # Warm up imports and model loading so they are not billed to the first
+    # stage; progress messages would otherwise interleave with the report.
+    with contextlib.redirect_stdout(io.StringIO()):
+        import threat_detector
+        threat_detector.load_model_artifacts()
+        threat_detector.load_head_models()
+        try:
+            import data_processor  # noqa: F401 - loads the spaCy model
+        except (ImportError, OSError):
+            pass
+
+    results = []
+    for size in sizes:
+        items = generate_synthetic_items(size, seed=seed, vocab=vocab)
+        for name in stages:
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = _measure(name, items)
+            except (ImportError, OSError) as e:
+                result = {"stage": name, "size": size, "skipped": str(e)}
+            results.append(result)
+            _print_result(result)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": seed,
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+
+
+def _print_result(result):
+    if "skipped" in result:
+        print(f"{result['stage']:>12} n={result['size']:<9} skipped: {result['skipped']}")
+        return
+    print(f"{result['stage']:>12} n={result['size']:<9} "
+          f"{result['seconds']:>10.3f}s {result['items_per_sec']:>12.1f} items/s "
+          f"{result['bytes_per_item']:>10.1f} B/item")
+
+
+def save_results(document, path=None):
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{document['meta']['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    return path
+
+
+def compare_results(old_path, new_path):
+    """Prints the throughput and memory ratio (new / old) per stage and size."""
+    with open(old_path) as f:
+        old = {(r["stage"], r["size"]): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {(r["stage"], r["size"]): r for r in json.load(f)["results"]}
+
+    print(f"{'stage':>12} {'size':>9} {'items/s':>10} {'B/item':>10}")
+    for key in sorted(set(old) & set(new)):
+        a, b = old[key], new[key]
+        if "skipped" in a or "skipped" in b:
+            continue
+        speed = b["items_per_sec"] / a["items_per_sec"]
+        memory = b["bytes_per_item"] / a["bytes_per_item"] if a["bytes_per_item"] else float("nan")
+        print(f"{key[0]:>12} {key[1]:>9} {speed:>9.2f}x {memory:>9.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the threat detection pipeline.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma separated item counts (default: %(default)s)")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help="Comma separated stages (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="Results path (default: benchmark_results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="Diff two results files instead of running")
+    parser.add_argument("--text-paths", action="store_true",
+                        help="Compare string vs cached-token text handling per item on the dataset")
+    parser.add_argument("--heads", action="store_true",
+                        help="Report the marginal cost of each multi-head classifier")
+    parser.add_argument("--parsers", action="store_true",
+                        help="Compare forum page parse time on saved HTML fixtures")
+    parser.add_argument("--ioc-screen", action="store_true",
+                        help="Report Bloom filter false-positive rate, size and lookup cost")
+    parser.add_argument("--sharding", action="store_true",
+                        help="Compare in-process vs sharded worker throughput")
+    parser.add_argument("--transport", action="store_true",
+                        help="Compare pickled vs shared-memory feature batches between processes")
+    parser.add_argument("--triage", action="store_true",
+                        help="Compare forest-only vs distilled two-tier scoring")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+    if args.text_paths:
+        compare_text_paths()
+        return
+    if args.heads:
+        compare_head_cost()
+        return
+    if args.parsers:
+        compare_parsers()
+        return
+    if args.ioc_screen:
+        compare_ioc_screen()
+        return
+    if args.sharding:
+        compare_sharding()
+        return
+    if args.transport:
+        compare_feature_transport()
+        return
+    if args.triage:
+        compare_triage()
+        return
+
+    document = run_benchmarks(
+        sizes=[int(s) for s in args.sizes.split(",")],
+        stages=args.stages.split(","),
+        seed=args.seed,
+    )
+    print(f"\nResults saved to {save_results(document, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# change_log.py
+# Append-only change log of analyzed threats for live dashboards.
+#
+# The pipeline appends every analyzed item as one JSON line. Readers keep a
+# byte offset into the file as their cursor and each poll reads only what
+# was appended since, so a refresh costs O(new items) rather than
+# re-fetching and re-predicting everything. LiveThreatView keeps the
+# dashboard's frames and summary metrics and updates both from each delta.
+#
+# The log is capped: once it reaches MAX_LOG_BYTES it is renamed to
+# "<path>.1" (replacing the previous one) and a new segment starts; readers
+# finish the renamed segment before moving on. Each segment begins with a
+# header line carrying a random id, which is how readers tell segments apart
+# (inode numbers are reused once an old segment is deleted). The publisher
+# also keeps running totals next to the log ("<path>.summary.json"), so a
+# new dashboard session takes its metrics from there and replays only
+# START_BYTES of the log's tail for its tables (open_live_view) instead of
+# the whole history.
+import json
+import os
+from collections import Counter
+from datetime import datetime, timezone
+
+import pandas as pd
+
+CHANGE_LOG_PATH = os.getenv("CHANGE_LOG_PATH", "threat_changes.jsonl")
+# Fields of an analyzed item that dashboards need; the rest stays in the DB
+PUBLISHED_FIELDS = (
+    "source", "text", "url", "timestamp", "is_threat", "threat_class", "confidence",
+    "ioc_matches", "threat_category", "attack_vector", "severity",
+)
+MAX_POLL_BYTES = 16 * 1024 * 1024  # catch up on a large backlog in steps
+MAX_LOG_BYTES = 64 * 1024 * 1024  # segment size before rotation
+START_BYTES = 4 * 1024 * 1024  # log tail a new session replays for its tables
+MAX_VIEW_ROWS = 50_000  # rows a LiveThreatView keeps for tables and exports
+
+
+def rotated_path(path):
+    return path + ".1"
+
+
+def summary_path(path):
+    return path + ".summary.json"
+
+
+def read_segment(path):
+    """
+    The id in a segment's header line: "" for a log without one, None if
+    the file does not exist or its first line is not complete yet.
+    """
+    try:
+        with open(path, "rb") as f:
+            line = f.readline()
+    except FileNotFoundError:
+        return None
+    if not line.endswith(b"\n"):
+        return None
+    return json.loads(line).get("segment", "")
+
+
+def _parse(data):
+    records = (json.loads(line) for line in data.splitlines() if line.strip())
+    return [record for record in records if "segment" not in record]
+
+
+def load_summary(path=CHANGE_LOG_PATH):
+    """The publisher's running totals, or None if there are none yet."""
+    try:
+        with open(summary_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _update_summary(path, records, segment, offset):
+    summary = load_summary(path) or {
+        "total": 0, "class_counts": {}, "class_confidence": {}, "source_counts": {}}
+    for record in records:
+        summary["total"] += 1
+        threat_class, source = record.get("threat_class"), record.get("source")
+        if threat_class is not None:
+            summary["class_counts"][threat_class] = summary["class_counts"].get(threat_class, 0) + 1
+            summary["class_confidence"][threat_class] = (
+                summary["class_confidence"].get(threat_class, 0.0) + (record.get("confidence") or 0.0))
+        if source is not None:
+            summary["source_counts"][source] = summary["source_counts"].get(source, 0) + 1
+    # Totals cover the log up to this offset of this segment
+    summary["segment"] = segment
+    summary["offset"] = offset
+    tmp = f"{summary_path(path)}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(summary, f)
+    os.replace(tmp, summary_path(path))
+
+
+def publish_threats(threats, path=CHANGE_LOG_PATH, max_bytes=MAX_LOG_BYTES):
+    """
+    Appends analyzed items to the change log, starting a new segment first
+    if the current one has reached max_bytes, and updates the summary.
+
+    All lines go out in one append, and readers only consume complete
+    lines, so a reader polling mid-write never sees a partial record.
+
+    Returns:
+        int: Number of records published.
+    """
+    published_at = datetime.now(timezone.utc).isoformat()
+    records = []
+    for threat in threats:
+        record = {field: threat[field] for field in PUBLISHED_FIELDS if field in threat}
+        record["published_at"] = published_at
+        records.append(record)
+    if records:
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size >= max_bytes:
+            os.replace(path, rotated_path(path))
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        if size == 0 or size >= max_bytes:
+            segment = os.urandom(8).hex()
+            lines = json.dumps({"segment": segment, "started_at": published_at}) + "\n" + lines
+        else:
+            segment = read_segment(path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            offset = f.tell()
+        _update_summary(path, records, segment, offset)
+    return len(records)
+
+
+class ChangeLogReader:
+    """
+    Tails the change log from a byte-offset cursor.
+
+    After a rotation the rest of the renamed segment is read before the
+    new one. If records were lost instead (the log was truncated, or
+    rotated twice between polls), the cursor restarts at 0 of the current
+    segment and ``reset`` is set so the consumer can drop what it has cached.
+    """
+
+    def __init__(self, path=CHANGE_LOG_PATH, cursor=0, segment=None):
+        self.path = path
+        self.cursor = cursor
+        self.reset = False
+        self.segment = segment
+
+    def poll(self, max_bytes=MAX_POLL_BYTES):
+        """Returns the records appended since the last poll."""
+        self.reset = False
+        segment = read_segment(self.path)
+        if segment is None:  # no log yet, or a new segment is being written
+            return []
+        if self.segment is not None and segment != self.segment:
+            previous = rotated_path(self.path)
+            if read_segment(previous) == self.segment:
+                records = self._read(previous, max_bytes)
+                if records:
+                    return records
+            else:
+                self.reset = True
+            self.cursor = 0
+        elif os.path.getsize(self.path) < self.cursor:
+            self.cursor = 0
+            self.reset = True
+        self.segment = segment
+        return self._read(self.path, max_bytes)
+
+    def _read(self, path, max_bytes):
+        with open(path, "rb") as f:
+            f.seek(self.cursor)
+            data = f.read(max_bytes)
+        end = data.rfind(b"\n") + 1  # leave an incomplete last line for the next poll
+        self.cursor += end
+        return _parse(data[:end])
+
+
+class LiveThreatView:
+    """
+    Cached dashboard frames plus running metrics, updated from deltas.
+
+    Each batch of records becomes one DataFrame chunk; per-class counts and
+    confidence sums are updated from that chunk alone. recent() builds the
+    displayed rows from the newest chunks only, so neither metrics nor the
+    table cost O(total threats) per refresh. frame() concatenates
+    everything and is meant for exports.
+
+    Only the newest ``max_rows`` rows are kept; the counters keep covering
+    everything applied.
+
+    Placeholder rows added with seed() (e.g. demo data shown before the
+    pipeline has published anything) are dropped by the first update()
+    that brings real records, so they never stay in the counters.
+
+    Args:
+        predict (callable, optional): Maps a Series of texts to the
+            dashboard's 'predicted_threat' column; applied to new chunks only.
+        max_rows (int): Rows kept for recent() and frame().
+    """
+
+    def __init__(self, predict=None, max_rows=MAX_VIEW_ROWS):
+        self.predict = predict
+        self.max_rows = max_rows
+        self.clear()
+
+    def clear(self):
+        self.chunks = []
+        self.total = 0
+        self.class_counts = Counter()
+        self.class_confidence = Counter()
+        self.source_counts = Counter()
+        self.rows = 0  # rows kept in chunks
+        self.seeded = False
+        self._frame = None
+        self._version = 0
+
+    def restore(self, summary):
+        """Sets the counters from load_summary() totals."""
+        self.total = summary["total"]
+        self.class_counts = Counter(summary["class_counts"])
+        self.class_confidence = Counter(summary["class_confidence"])
+        self.source_counts = Counter(summary["source_counts"])
+
+    def apply(self, records, count=True):
+        """
+        Appends a delta of change log records; returns the rows added.
+        With count=False the rows are only shown (their counts are already
+        in restore()d totals).
+        """
+        if not records:
+            return 0
+        chunk = pd.DataFrame.from_records(records)
+        timestamp = chunk["timestamp"] if "timestamp" in chunk else pd.Series(pd.NaT, index=chunk.index)
+        chunk["timestamp"] = pd.to_datetime(timestamp, errors="coerce", utc=True, format="mixed")
+        if "published_at" in chunk:
+            # Items without a parseable source timestamp show when they were published
+            chunk["timestamp"] = chunk["timestamp"].fillna(pd.to_datetime(chunk["published_at"], utc=True))
+        chunk["end_time"] = chunk["timestamp"] + pd.Timedelta(hours=1)
+        if "confidence" not in chunk:
+            chunk["confidence"] = 0.0
+        if self.predict is not None:
+            chunk["predicted_threat"] = self.predict(chunk["text"])
+
+        if count:
+            stats = chunk.groupby("threat_class")["confidence"].agg(["count", "sum"])
+            self.class_counts.update(stats["count"].to_dict())
+            self.class_confidence.update(stats["sum"].to_dict())
+            self.source_counts.update(chunk["source"].value_counts().to_dict())
+            self.total += len(chunk)
+        self.chunks.append(chunk)
+        self.rows += len(chunk)
+        while self.rows - len(self.chunks[0]) >= self.max_rows:
+            self.rows -= len(self.chunks.pop(0))
+        if self.rows > self.max_rows:
+            self.chunks[0] = self.chunks[0].iloc[self.rows - self.max_rows:]
+            self.rows = self.max_rows
+        self._version += 1
+        return len(chunk)
+
+    def seed(self, records):
+        """Shows placeholder records until the first real delta replaces them."""
+        added = self.apply(records)
+        self.seeded = True
+        return added
+
+    def update(self, reader):
+        """Polls a ChangeLogReader and applies the delta; returns the rows added."""
+        records = reader.poll()
+        if reader.reset or (self.seeded and records):
+            self.clear()
+        return self.apply(records)
+
+    def metrics(self, classes=None):
+        """
+        Returns (count, critical count, mean confidence) for the given
+        threat classes (all if None), from the running counters.
+        """
+        classes = self.class_counts.keys() if classes is None else classes
+        count = sum(self.class_counts[c] for c in classes)
+        confidence = sum(self.class_confidence[c] for c in classes)
+        critical = self.class_counts["critical"] if "critical" in classes else 0
+        return count, critical, confidence / count if count else 0.0
+
+    def recent(self, n=500, classes=None):
+        """The newest n rows (optionally of the given classes), newest chunk last."""
+        parts, rows = [], 0
+        for chunk in reversed(self.chunks):
+            if classes is not None:
+                chunk = chunk[chunk["threat_class"].isin(classes)]
+            parts.append(chunk.tail(n - rows))
+            rows += len(parts[-1])
+            if rows >= n:
+                break
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(reversed(parts), ignore_index=True)
+
+    def frame(self):
+        """Every row kept (see max_rows), concatenated once per new delta."""
+        if self._frame is None or self._frame_version != self._version:
+            self._frame = pd.concat(self.chunks, ignore_index=True) if self.chunks else pd.DataFrame()
+            self._frame_version = self._version
+        return self._frame
+
+
+def open_live_view(path=CHANGE_LOG_PATH, predict=None, start_bytes=START_BYTES, max_rows=MAX_VIEW_ROWS):
+    """
+    A LiveThreatView and ChangeLogReader for a new session.
+
+    The counters are restored from the publisher's summary and only the
+    last start_bytes of the log before the summary's offset are replayed,
+    for the tables; the reader carries on from that offset. Without a usable
+    summary (none yet, or the log rotated in between) the reader starts at
+    the beginning of the current segment and the first update() replays it.
+
+    Returns:
+        tuple: (LiveThreatView, ChangeLogReader)
+    """
+    view = LiveThreatView(predict=predict, max_rows=max_rows)
+    summary = load_summary(path)
+    segment = read_segment(path)
+    if (summary is None or segment is None or summary.get("segment") != segment
+            or summary["offset"] > os.path.getsize(path)):
+        return view, ChangeLogReader(path)
+
+    offset = summary["offset"]
+    # One byte early, so a start that falls right after a newline keeps its line
+    start = max(0, offset - start_bytes - 1)
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(offset - start)
+    if start > 0:
+        data = data[data.find(b"\n") + 1:]  # from the first complete line
+    view.apply(_parse(data), count=False)
+    view.restore(summary)
+    return view, ChangeLogReader(path, cursor=offset, segment=segment)
+
+
+if __name__ == "__main__":
+    # A writer appends batches while a reader tails the log; the running
+    # metrics must match a full recount.
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "changes.jsonl")
+    reader = ChangeLogReader(path)
+    view = LiveThreatView()
+    classes = ["critical", "suspicious", "benign"]
+    for batch in range(5):
+        publish_threats([{
+            "source": f"feed{i % 3}", "text": f"item {batch}-{i}", "threat_class": classes[i % 3],
+            "confidence": (i % 10) / 10, "is_threat": i % 3 != 2, "timestamp": None,
+        } for i in range(1000)], path)
+        with open(path, "a") as f:
+            f.write('{"source": "partial')  # a write still in progress
+        added = view.update(reader)
+        with open(path, "rb+") as f:  # the writer finishes its line
+            f.seek(-len('{"source": "partial'), os.SEEK_END)
+            f.truncate()
+        print(f"batch {batch}: +{added} rows, cursor {reader.cursor}")
+
+    full = view.frame()
+    print("metrics:", view.metrics(["critical", "suspicious"]))
+    print("recount:", (len(full[full.threat_class != "benign"]),
+                       int((full.threat_class == "critical").sum()),
+                       full[full.threat_class != "benign"].confidence.mean()))
+    open(path, "w").close()  # truncated
+    publish_threats([{"source": "feed0", "text": "after", "threat_class": "benign"}], path)
+    view.update(reader)
+    print("after truncation:", reader.reset, view.total)
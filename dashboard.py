@@ -4,7 +4,10 @@ import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 import joblib
+import os
 import requests
+from change_log import CHANGE_LOG_PATH, ChangeLogReader, LiveThreatView, open_live_view
+from threat_stats import STATS_SNAPSHOT_PATH, load_snapshot
 
 # Load trained model and vectorizer
 vectorizer = joblib.load('improved_vectorizer.joblib')
@@ -13,6 +16,12 @@ classifier = joblib.load('improved_classifier.joblib')
 # Sample threat feed endpoint (replace with a real API or DB connection)
 THREAT_FEED_URL = "https://example.com/api/threats"  # <-- Replace with real URL
 
+# Seconds between polls of the pipeline's change log
+REFRESH_SECONDS = 5
+# Rows drawn in the timeline and table; metrics always cover everything
+DISPLAY_ROWS = 500
+THREAT_CLASSES = ['critical', 'high', 'medium', 'suspicious', 'benign']
+
 # Authentication credentials (placeholder)
 USERNAME = st.secrets.get("username", "admin")
 PASSWORD = st.secrets.get("password", "password")
@@ -48,51 +57,90 @@ def predict_threat(text_series):
     X_vec = vectorizer.transform(text_series)
     return classifier.predict(X_vec)
 
-def main():
-    if "authenticated" not in st.session_state:
-        st.session_state["authenticated"] = False
-
-    if not st.session_state["authenticated"]:
-        authenticate()
-        return
-
-    st.title("Cyber Threat Intelligence Dashboard")
-
-    # Load data
-    threat_data = load_data()
-    threat_data['timestamp'] = pd.to_datetime(threat_data['timestamp'])
-    threat_data['end_time'] = threat_data['timestamp'] + pd.Timedelta(hours=1)
-
-    # Predict threat (1 = potential threat, 0 = benign)
-    threat_data['predicted_threat'] = predict_threat(threat_data['text'])
-
-    # Threat class ordering
-    threat_data['threat_class'] = pd.Categorical(
-        threat_data['threat_class'], 
-        categories=['critical', 'high', 'medium'], 
-        ordered=True
-    )
-
-    # Filter
-    st.sidebar.header("Filters")
-    threat_levels = st.sidebar.multiselect(
-        "Filter by Threat Class", 
-        options=threat_data['threat_class'].unique(), 
-        default=threat_data['threat_class'].unique()
-    )
-    filtered_data = threat_data[threat_data['threat_class'].isin(threat_levels)]
+def get_live_view():
+    """
+    Per-session view and change log cursor. A new session starts from the
+    change log's summary and recent tail (open_live_view). Without a change
+    log (the pipeline has not run yet) the view is seeded from load_data();
+    those rows are dropped once the first published records arrive.
+    """
+    if "live_view" not in st.session_state:
+        if os.path.exists(CHANGE_LOG_PATH):
+            view, reader = open_live_view(CHANGE_LOG_PATH, predict=predict_threat)
+        else:
+            view = LiveThreatView(predict=predict_threat)
+            view.seed(load_data().to_dict("records"))
+            reader = ChangeLogReader(CHANGE_LOG_PATH)
+        st.session_state["live_view"] = view
+        st.session_state["change_reader"] = reader
+    return st.session_state["live_view"], st.session_state["change_reader"]
+
+def get_stats_snapshot():
+    """Pipeline's precomputed rolling windows, re-read only when the file changes."""
+    if not os.path.exists(STATS_SNAPSHOT_PATH):
+        return None
+    mtime = os.path.getmtime(STATS_SNAPSHOT_PATH)
+    if st.session_state.get("stats_mtime") != mtime:
+        st.session_state["stats_snapshot"] = load_snapshot(STATS_SNAPSHOT_PATH)
+        st.session_state["stats_mtime"] = mtime
+    return st.session_state["stats_snapshot"]
+
+def volume_panel(snapshot):
+    # Everything here comes from threat_stats windows, not from raw rows
+    minutes = snapshot['window_seconds'] // 60
+    st.subheader(f"Volume (last {minutes} min)")
+    if snapshot['series']:
+        series = pd.DataFrame(snapshot['series'], columns=['bucket', 'items'])
+        series['bucket'] = pd.to_datetime(series['bucket'])
+        st.line_chart(series, x='bucket', y='items')
+
+    col1, col2 = st.columns(2)
+    col1.caption("Items per source")
+    col1.bar_chart(pd.DataFrame(snapshot['windows']['source'], columns=['source', 'items']),
+                   x='source', y='items')
+    col2.caption("Items per category")
+    col2.bar_chart(pd.DataFrame(snapshot['windows']['category'], columns=['category', 'items']),
+                   x='category', y='items')
+
+    col1, col2 = st.columns(2)
+    col1.caption("Top actors (recent)")
+    col1.dataframe(pd.DataFrame(snapshot['top']['actor'], columns=['actor', 'mentions']), hide_index=True)
+    col2.caption("Top keywords (recent)")
+    col2.dataframe(pd.DataFrame(snapshot['top']['keyword'], columns=['keyword', 'mentions']), hide_index=True)
+
+    if snapshot['spikes']:
+        st.caption("Volume spikes")
+        st.dataframe(pd.DataFrame(snapshot['spikes'][::-1]), hide_index=True)
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def live_panel(threat_levels):
+    # Reruns on its own every REFRESH_SECONDS, applying only new records
+    view, reader = get_live_view()
+    view.update(reader)
+    recent = view.recent(DISPLAY_ROWS, classes=threat_levels)
+    if view.seeded:
+        st.caption("Showing demo data until the pipeline publishes its first threats.")
 
     # Threat summary
     st.subheader("Threat Summary")
+    total, critical, confidence = view.metrics(threat_levels)
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total Threats", len(filtered_data))
-    col2.metric("Critical Threats", len(filtered_data[filtered_data['threat_class'] == 'critical']))
-    col3.metric("Detection Confidence", f"{filtered_data['confidence'].mean():.0%}")
+    col1.metric("Total Threats", total)
+    col2.metric("Critical Threats", critical)
+    col3.metric("Detection Confidence", f"{confidence:.0%}")
+
+    snapshot = get_stats_snapshot()
+    if snapshot is not None:
+        volume_panel(snapshot)
+
+    if recent.empty:
+        st.info("No threats match the selected classes yet.")
+        return
 
     # Threat timeline
     st.subheader("Threat Timeline")
     fig = px.timeline(
-        filtered_data,
+        recent,
         x_start='timestamp',
         x_end='end_time',
         y='source',
@@ -103,17 +151,43 @@ def main():
     st.plotly_chart(fig)
 
     # Threat details with prediction
-    st.subheader("Threat Details")
-    filtered_data['timestamp'] = filtered_data['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
-    st.dataframe(filtered_data[['source', 'text', 'threat_class', 'confidence', 'timestamp', 'predicted_threat']])
-
-    # Export data
-    st.download_button(
-        "Download CSV", 
-        data=filtered_data.to_csv(index=False), 
-        file_name="threats.csv", 
-        mime="text/csv"
+    st.subheader(f"Threat Details (latest {len(recent)})")
+    recent['timestamp'] = recent['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    st.dataframe(recent[['source', 'text', 'threat_class', 'confidence', 'timestamp', 'predicted_threat']])
+
+def main():
+    if "authenticated" not in st.session_state:
+        st.session_state["authenticated"] = False
+
+    if not st.session_state["authenticated"]:
+        authenticate()
+        return
+
+    st.title("Cyber Threat Intelligence Dashboard")
+
+    view, _ = get_live_view()
+
+    # Filter
+    st.sidebar.header("Filters")
+    threat_levels = st.sidebar.multiselect(
+        "Filter by Threat Class", 
+        options=THREAT_CLASSES, 
+        default=THREAT_CLASSES
     )
 
+    live_panel(threat_levels)
+
+    # Export data: the full frame is only built on request, and covers the
+    # rows the view keeps (the newest LiveThreatView.max_rows)
+    if st.sidebar.button("Prepare CSV"):
+        export = view.frame()
+        export = export[export['threat_class'].isin(threat_levels)]
+        st.sidebar.download_button(
+            "Download CSV", 
+            data=export.to_csv(index=False), 
+            file_name="threats.csv", 
+            mime="text/csv"
+        )
+
 if __name__ == "__main__":
     main()
@@ -1,10 +1,11 @@
 # data_collector.py
 import requests
-from bs4 import BeautifulSoup
 import os
 import feedparser
 from dotenv import load_dotenv
 from pymisp import ExpandedPyMISP
+from html_extractor import SITE_CONFIGS, extract_site
+from utils import CircuitOpenError, rate_limited, retry, host_key
 load_dotenv()
 
 # RSS feeds
@@ -43,10 +44,14 @@ def get_rss_threats(feed_urls):
     return threats
 
 
+@rate_limited(30, key=host_key)
+def fetch_feed(url):
+    return feedparser.parse(url)
+
 def get_rss_threats(feed_urls):
     threats = []
     for url in feed_urls:
-        feed = feedparser.parse(url)
+        feed = fetch_feed(url)
         for entry in feed.entries:
             threats.append({
                 'source': 'rss',
@@ -56,19 +61,28 @@ def get_rss_threats(feed_urls):
             })
     return threats
 
+# Retried with jittered backoff, every attempt rate limited per host; thread-safe
+@retry(max_retries=3)
+@rate_limited(30, key=host_key)
+def fetch_page(url):
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    return response.text
+
+# Forum collector driven by the per-site configs in html_extractor.SITE_CONFIGS
+def get_forum_samples(site, fingerprints=None):
+    # Pass a tor_crawler.FingerprintStore to skip pages unchanged since the last run
+    # A failed fetch yields no items instead of aborting the whole collection run
+    config = SITE_CONFIGS[site]
+    try:
+        html = fetch_page(config['url'])
+    except (requests.RequestException, CircuitOpenError) as e:
+        print(f"Error fetching {site} forum: {e}")
+        return []
+    return extract_site(site, html, url=config['url'], fingerprints=fingerprints)
+
 # Dark Web Collector (Simplified)
-def get_darkweb_samples():
+def get_darkweb_samples(fingerprints=None):
     # In production: Use Tor with Stem library
     # For MVP: Simulate with clearnet security forums
-    threats = []
-    response = requests.get("https://security.stackexchange.com/questions?sort=newest")
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    for question in soup.select('.question-summary')[:20]:
-        threats.append({
-            'text': question.select_one('.question-hyperlink').text,
-            'source': 'security_forum',
-            'timestamp': question.select_one('.relativetime')['title'],
-            'url': "https://security.stackexchange.com" + question.select_one('.question-hyperlink')['href']
-        })
-    return threats
\ No newline at end of file
+    return get_forum_samples('security_stackexchange', fingerprints=fingerprints)
\ No newline at end of file
@@ -1,6 +1,7 @@
 # data_loader.py
 # This module is responsible for loading and initial preprocessing of datasets.
 
+import ast
 import pandas as pd
 import os
 
@@ -54,6 +55,70 @@ def load_threat_dataset(path='Cybersecurity_Dataset.csv'):
     
     return df[['text', 'is_threat']] # Return only the newly created 'text' and 'is_threat' columns
 
+# Dataset columns predicted by the multi-head classifier (see threat_detector.analyze_data)
+HEAD_COLUMNS = {
+    'threat_category': 'Threat Category',
+    'attack_vector': 'Attack Vector',
+    'severity': 'Severity Score',
+}
+
+def load_threat_heads_dataset(path='Cybersecurity_Dataset.csv'):
+    """
+    Loads the dataset for training the multi-head classifier.
+
+    Args:
+        path (str): The file path to the dataset CSV.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with a 'text' column plus one label
+                          column per head in HEAD_COLUMNS. Returns an empty
+                          DataFrame if the file or a column is missing.
+    """
+    columns = ['text'] + list(HEAD_COLUMNS)
+    if not os.path.exists(path):
+        print(f"Error: Dataset file not found at '{path}'.")
+        return pd.DataFrame(columns=columns)
+
+    df = pd.read_csv(path)
+    required = ['Cleaned Threat Description'] + list(HEAD_COLUMNS.values())
+    missing = [c for c in required if c not in df.columns]
+    if missing:
+        print(f"Error: Dataset is missing columns: {missing}")
+        return pd.DataFrame(columns=columns)
+
+    df = df.dropna(subset=list(HEAD_COLUMNS.values()))
+    df['text'] = df['Cleaned Threat Description'].astype(str).fillna('')
+    for head, column in HEAD_COLUMNS.items():
+        df[head] = df[column]
+
+    print(f"Multi-head dataset loaded with {len(df)} entries.")
+    return df[columns]
+
+def literal_list_values(column):
+    """
+    Returns the sorted distinct items of a list-valued column, which the
+    dataset stores as Python list literals such as "['10.0.0.2', 'infected.exe']".
+    """
+    values = set()
+    for value in column.dropna().astype(str):
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            parsed = [value]
+        values.update(str(item) for item in (parsed if isinstance(parsed, (list, tuple)) else [parsed]))
+    return sorted(values)
+
+def load_dataset_iocs(path='Cybersecurity_Dataset.csv'):
+    """
+    Returns every indicator in the dataset's 'IOCs (Indicators of Compromise)' column.
+    """
+    column = 'IOCs (Indicators of Compromise)'
+    if not os.path.exists(path):
+        print(f"Error: Dataset file not found at '{path}'.")
+        return []
+    df = pd.read_csv(path, usecols=[column])
+    return literal_list_values(df[column])
+
 # Example usage (for testing this module directly)
 if __name__ == "__main__":
     # This block is just for testing data_loader.py in isolation.
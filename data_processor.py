@@ -5,12 +5,30 @@ from datetime import datetime
 
 nlp = spacy.load("en_core_web_sm")
 
+# URLs, @handles and special characters, compiled once at import
+STRIP_PATTERN = re.compile(r'http\S+|@\S+|[^A-Za-z0-9\s]+')
+THREAT_KEYWORDS = frozenset(["phish", "ransom", "malware", "exploit", "breach"])
+
 def preprocess_text(text):
     # Remove URLs, special characters
-    text = re.sub(r'http\S+|@\S+|[^A-Za-z0-9\s]+', '', text)
+    text = STRIP_PATTERN.sub('', text)
     return text.lower().strip()
 
-def extract_entities(text):
+def normalize_text(text):
+    """
+    Fast path combining preprocess_text with tokenization.
+
+    The returned tokens are what the keyword matcher and the TF-IDF
+    vectorizer would otherwise each re-derive from clean_text, so callers
+    should keep them alongside the item instead of splitting again.
+
+    Returns:
+        tuple: (clean_text, tokens)
+    """
+    clean_text = STRIP_PATTERN.sub('', text).lower().strip()
+    return clean_text, clean_text.split()
+
+def extract_entities(text, tokens=None):
     doc = nlp(text)
     entities = {
         "orgs": [],
@@ -24,10 +42,9 @@ def extract_entities(text):
         elif ent.label_ == "GPE":
             entities["tech"].append(ent.text)
     
-    # Simple threat keyword matching
-    threat_keywords = ["phish", "ransom", "malware", "exploit", "breach"]
-    for word in text.split():
-        if word in threat_keywords:
+    # Simple threat keyword matching, reusing the cached token stream if given
+    for word in (tokens if tokens is not None else text.split()):
+        if word in THREAT_KEYWORDS:
             entities["threats"].append(word)
             
     return entities
@@ -35,12 +52,13 @@ def extract_entities(text):
 def process_data(raw_data):
     processed = []
     for item in raw_data:
-        clean_text = preprocess_text(item['text'])
-        entities = extract_entities(clean_text)
+        clean_text, tokens = normalize_text(item['text'])
+        entities = extract_entities(clean_text, tokens)
         
         processed.append({
             **item,
             "clean_text": clean_text,
+            "tokens": tokens,
             "entities": entities,
             "processed_at": datetime.now().isoformat()
         })
@@ -1,10 +1,15 @@
 # main.py
+import os
 from data_collector import get_rss_threats,get_darkweb_samples
 from data_processor import process_data
 from threat_detector import analyze_data
 from alert_system import monitor_threats
+from threat_intel import get_ioc_index, IOC_INDEX_PATH
+from sharded_pipeline import DroppedBatchesError, run_sharded
+from change_log import publish_threats
+from threat_stats import get_threat_stats
 
-def run_pipeline():
+def run_pipeline(workers=1):
     # Collect data
     raw_data = []
 
@@ -20,18 +25,34 @@ def run_pipeline():
     
     raw_data.extend(get_darkweb_samples())
     
-    # Process data
-    processed = process_data(raw_data)
-    
-    # Analyze threats
-    analyzed = analyze_data(processed)
+    if workers > 1:
+        # Sharded: worker processes with warm spaCy/model copies process and analyze batches
+        ioc_index_path = IOC_INDEX_PATH if os.path.exists(IOC_INDEX_PATH) else None
+        try:
+            analyzed = run_sharded(raw_data, workers=workers, ioc_index_path=ioc_index_path)
+        except DroppedBatchesError as e:
+            # Carry on with the batches that were analyzed
+            print(f"[!] {len(e.failed_items)} items not analyzed: {e}")
+            analyzed = e.analyzed
+    else:
+        # Process data
+        processed = process_data(raw_data)
+
+        # Analyze threats, flagging IOCs known from the last OTX sync (threat_intel.sync_otx)
+        analyzed = analyze_data(processed, ioc_index=get_ioc_index() or None)
     
-    # Alert on critical threats
-    monitor_threats(analyzed)
+    # Alert on critical threats and volume spikes; the rolling windows are
+    # saved for dashboards (threat_stats.load_snapshot)
+    stats = get_threat_stats()
+    monitor_threats(analyzed, stats=stats)
+    stats.save()
+
+    # Push the new results to live dashboards (change_log.ChangeLogReader)
+    publish_threats(analyzed)
     
     return analyzed
 
 if __name__ == "__main__":
-    threats = run_pipeline()
+    threats = run_pipeline(workers=int(os.getenv("PIPELINE_WORKERS", "1")))
     print(f"Processed {len(threats)} items, found {sum(t['is_threat'] for t in threats)} threats")
     
\ No newline at end of file
@@ -2,6 +2,11 @@
 import streamlit as st
 import hashlib
 import os
+from change_log import open_live_view
+
+# Seconds between change log polls, and rows shown in the feed
+REFRESH_SECONDS = 5
+FEED_ROWS = 200
 
 # Simple credential storage (use proper secrets management in production)
 CREDENTIALS = {
@@ -25,6 +30,26 @@ def login():
             st.sidebar.error("User not found")
     return False
 
+@st.fragment(run_every=REFRESH_SECONDS)
+def live_feed():
+    # Only the records appended since this session's cursor are read
+    if "live_view" not in st.session_state:
+        st.session_state.live_view, st.session_state.change_reader = open_live_view()
+    view = st.session_state.live_view
+    view.update(st.session_state.change_reader)
+
+    total, critical, confidence = view.metrics()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Analyzed Items", total)
+    col2.metric("Critical Threats", critical)
+    col3.metric("Mean Confidence", f"{confidence:.0%}")
+
+    recent = view.recent(FEED_ROWS)
+    if recent.empty:
+        st.info("Waiting for the pipeline to publish results...")
+    else:
+        st.dataframe(recent[['source', 'text', 'threat_class', 'confidence', 'timestamp']].iloc[::-1])
+
 def main():
     if 'authenticated' not in st.session_state or not st.session_state.authenticated:
         if login():
@@ -32,9 +57,8 @@ def main():
         else:
             return
     
-    # Your existing dashboard code here
     st.title("Secure Threat Intelligence Dashboard")
-    # ... rest of the dashboard
+    live_feed()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,253 @@
+# sharded_pipeline.py
+# Runs process_data + analyze_data across several worker processes.
+#
+# The coordinator cuts collected items into batches and hands them to
+# workers over per-worker queues. Each worker loads spaCy, the models and
+# the IOC index once and keeps them warm for every batch it handles. Results
+# come back on a shared queue and are re-ordered by batch number, so callers
+# see items in the order they were collected. Each worker reports ready once
+# its models are loaded. If a ready worker dies, its in-flight batch is
+# re-queued and the worker replaced; a worker that dies while starting up (or
+# too many crashes overall) aborts the run, since a replacement would only
+# fail the same way. A batch that keeps failing is dropped so the rest of the
+# run can finish; the run then ends with DroppedBatchesError, which carries
+# the dropped raw items.
+import logging
+import multiprocessing as mp
+import os
+import queue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 256
+MAX_BATCH_ATTEMPTS = 3
+MAX_WORKER_CRASHES = 10
+POLL_INTERVAL = 0.5  # seconds between worker liveness checks
+
+
+class DroppedBatchesError(RuntimeError):
+    """
+    Raised by iter_sharded() once every other batch has been yielded, if
+    some batches were dropped after max_attempts failures.
+
+    Attributes:
+        failed (dict): Batch id -> (raw items, last error) per dropped batch.
+        analyzed (list): The other batches' analyzed items, in input order
+            (filled in by run_sharded()).
+    """
+
+    def __init__(self, failed):
+        self.failed = failed
+        self.analyzed = []
+        items = sum(len(batch) for batch, _ in failed.values())
+        super().__init__(f"{len(failed)} batches ({items} items) dropped after repeated failures: "
+                         + ", ".join(f"batch {batch_id}: {error}" for batch_id, (_, error) in failed.items()))
+
+    @property
+    def failed_items(self):
+        """Raw items of the dropped batches, in input order."""
+        return [item for batch_id in sorted(self.failed) for item in self.failed[batch_id][0]]
+
+
+def _worker_main(worker_id, task_queue, result_queue, multihead, ioc_index_path):
+    # Imported here so every process loads its own warm copy
+    from data_processor import process_data
+    import threat_detector
+    from threat_detector import analyze_data
+
+    try:
+        threat_detector.load_model_artifacts()
+        if multihead:
+            threat_detector.load_head_models()
+        ioc_index = None
+        if ioc_index_path:
+            from threat_intel import IOCIndex
+            # Memory-mapped, so all workers share one copy through the page cache
+            ioc_index = IOCIndex.load(ioc_index_path)
+    except Exception as e:
+        result_queue.put((worker_id, None, None, repr(e)))
+        return
+    # Batch id None is the startup handshake
+    result_queue.put((worker_id, None, None, None))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        batch_id, items = task
+        try:
+            analyzed = analyze_data(process_data(items), multihead=multihead, ioc_index=ioc_index)
+            result_queue.put((worker_id, batch_id, analyzed, None))
+        except Exception as e:
+            result_queue.put((worker_id, batch_id, None, repr(e)))
+
+
+class _Worker:
+    def __init__(self, ctx, worker_id, result_queue, multihead, ioc_index_path):
+        self.worker_id = worker_id
+        self.task_queue = ctx.Queue()
+        self.batch_id = None  # batch in flight, if any
+        self.ready = False
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.task_queue, result_queue, multihead, ioc_index_path),
+            daemon=True,
+        )
+        self.process.start()
+
+    def assign(self, batch_id, items):
+        self.batch_id = batch_id
+        self.task_queue.put((batch_id, items))
+
+    def stop(self):
+        if self.process.is_alive():
+            self.task_queue.put(None)
+            self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+def iter_sharded(items, workers=None, batch_size=DEFAULT_BATCH_SIZE, multihead=False,
+                 ioc_index_path=None, start_method="spawn", max_attempts=MAX_BATCH_ATTEMPTS,
+                 max_crashes=MAX_WORKER_CRASHES):
+    """
+    Processes and analyzes items in worker processes, yielding analyzed
+    items in input order as soon as each batch and all before it are done.
+
+    Args:
+        items (list of dict): Raw collected items, as for process_data().
+        workers (int): Worker processes (default: CPU count).
+        batch_size (int): Items per batch sent to a worker.
+        multihead (bool): Passed through to analyze_data().
+        ioc_index_path (str, optional): Saved threat_intel.IOCIndex to
+            match IOCs against in every worker.
+        start_method (str): multiprocessing start method.
+        max_attempts (int): A batch whose worker crashes or raises this many
+            times is dropped instead of blocking the run.
+        max_crashes (int): Total worker crashes tolerated before giving up.
+
+    Raises:
+        RuntimeError: If a worker fails before reporting ready (e.g. its
+            models cannot be loaded) or more than max_crashes workers crash.
+        DroppedBatchesError: After all other items have been yielded, if
+            any batch was dropped; its ``failed`` holds the dropped raw
+            items, so they can be retried or reported.
+    """
+    workers = workers or os.cpu_count() or 1
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    if not batches:
+        return
+
+    ctx = mp.get_context(start_method)
+    result_queue = ctx.Queue()
+    pool = {}
+    pending = list(range(len(batches)))  # batch ids waiting for a worker
+    attempts = [0] * len(batches)
+    done = {}       # batch id -> analyzed items (None if dropped)
+    dropped = {}    # batch id -> last error
+    next_out = 0
+    spawned = crashes = 0
+
+    def spawn():
+        # Replacements get fresh ids so late messages from a dead worker are not mistaken for theirs
+        nonlocal spawned
+        worker = pool[spawned] = _Worker(ctx, spawned, result_queue, multihead, ioc_index_path)
+        spawned += 1
+        dispatch(worker)
+
+    def dispatch(worker):
+        while pending:
+            batch_id = pending.pop(0)
+            if batch_id >= next_out and batch_id not in done:
+                worker.assign(batch_id, batches[batch_id])
+                return
+
+    def fail(batch_id, reason):
+        attempts[batch_id] += 1
+        if attempts[batch_id] >= max_attempts:
+            logger.error(f"Dropping batch {batch_id} after {attempts[batch_id]} attempts: {reason}")
+            done[batch_id] = None
+            dropped[batch_id] = reason
+        else:
+            logger.warning(f"Re-queueing batch {batch_id} ({reason})")
+            pending.insert(0, batch_id)
+
+    def handle(message):
+        worker_id, batch_id, analyzed, error = message
+        worker = pool.get(worker_id)
+        if batch_id is None:
+            if error is not None:
+                raise RuntimeError(f"Worker {worker_id} failed to start: {error}")
+            if worker is not None:
+                worker.ready = True
+            return
+        if worker is not None and worker.batch_id == batch_id:
+            worker.batch_id = None
+        if batch_id >= next_out and batch_id not in done:  # a re-queued batch may report twice
+            if error is None:
+                done[batch_id] = analyzed
+            else:
+                fail(batch_id, error)
+        if worker is not None and worker.batch_id is None and worker.process.is_alive():
+            dispatch(worker)
+
+    def drain():
+        while True:
+            try:
+                handle(result_queue.get_nowait())
+            except queue.Empty:
+                return
+
+    try:
+        for _ in range(min(workers, len(batches))):
+            spawn()
+
+        while next_out < len(batches):
+            try:
+                handle(result_queue.get(timeout=POLL_INTERVAL))
+            except queue.Empty:
+                pass
+
+            for worker_id, worker in list(pool.items()):
+                if worker.process.is_alive():
+                    continue
+                if not worker.ready:
+                    drain()  # its handshake may have arrived after the last read
+                exitcode = worker.process.exitcode
+                if not worker.ready:
+                    raise RuntimeError(f"Worker {worker_id} exited with code {exitcode} before it was ready")
+                crashes += 1
+                if crashes > max_crashes:
+                    raise RuntimeError(f"Giving up after {crashes} worker crashes (last exit code {exitcode})")
+                logger.warning(f"Worker {worker_id} exited with code {exitcode}")
+                del pool[worker_id]
+                crashed = worker.batch_id
+                if crashed is not None and crashed >= next_out and crashed not in done:
+                    fail(crashed, f"worker {worker_id} crashed")
+                spawn()
+
+            while next_out in done:
+                yield from done.pop(next_out) or []
+                next_out += 1
+    finally:
+        for worker in pool.values():
+            worker.stop()
+
+    if dropped:
+        raise DroppedBatchesError({
+            batch_id: (batches[batch_id], dropped[batch_id]) for batch_id in sorted(dropped)})
+
+
+def run_sharded(items, **kwargs):
+    """
+    List form of iter_sharded(). On DroppedBatchesError the items analyzed
+    from the other batches are in the error's ``analyzed``.
+    """
+    analyzed = []
+    try:
+        analyzed.extend(iter_sharded(items, **kwargs))
+    except DroppedBatchesError as e:
+        e.analyzed = analyzed
+        raise
+    return analyzed
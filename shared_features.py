@@ -0,0 +1,352 @@
+# shared_features.py
+# Shared-memory transport for feature batches and model arrays.
+#
+# Passing a CSR matrix from vectorizer_model.transform through a
+# multiprocessing queue pickles its data/indices/indptr arrays, copies them
+# through a pipe and unpickles them again on the other side. Here the
+# producer writes the three arrays into one multiprocessing.shared_memory
+# block and sends only a small handle (block name, dtypes, shapes, offsets);
+# the consumer maps the block and builds a csr_matrix over it without
+# copying. Read-only model arrays are published the same way: SharedForest
+# flattens a fitted RandomForestClassifier into node arrays in shared memory
+# that every scoring process maps instead of unpickling its own copy.
+#
+# Nothing in the pipeline uses scoring_worker yet: sharded_pipeline workers
+# still load their own models. The __main__ block below exercises it.
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+ALIGNMENT = 64  # start every array on its own cache line
+
+
+def _sparse_lookup(X):
+    """
+    Returns lookup(rows, cols) -> float32 values of the CSR matrix X at
+    those positions, without densifying it.
+
+    Each stored entry gets the key row * n_cols + col, which is sorted in a
+    canonical CSR matrix, so one searchsorted finds every requested entry;
+    positions that are not stored are 0.
+    """
+    X = csr_matrix(X)
+    if not X.has_canonical_format:
+        X = X.copy()  # shared views are read-only
+        X.sum_duplicates()
+    n_cols = np.int64(X.shape[1])
+    counts = np.diff(X.indptr)
+    keys = np.repeat(np.arange(X.shape[0], dtype=np.int64) * n_cols, counts) + X.indices
+    data = X.data.astype(np.float32)
+
+    def lookup(rows, cols):
+        query = rows * n_cols + cols
+        if not len(keys):
+            return np.zeros(query.shape, dtype=np.float32)
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        return np.where(keys[pos] == query, data[pos], np.float32(0))
+    return lookup
+
+
+def _layout(arrays):
+    layout, size = [], 0
+    for name, array in arrays.items():
+        layout.append((name, array.dtype.str, array.shape, size))
+        size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    return layout, size
+
+
+class SharedArrays:
+    """
+    Named NumPy arrays in one shared memory block.
+
+    create() copies the arrays in; attach() in another process maps them
+    from the handle without copying (read-only). The creator must keep the
+    object alive while others use it and call unlink() when done.
+    """
+
+    def __init__(self, shm, layout, owner):
+        self.shm = shm
+        self.owner = owner
+        self._map(layout)
+
+    def _map(self, layout):
+        self.layout = layout
+        self.arrays = {
+            name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.shm.buf, offset=offset)
+            for name, dtype, shape, offset in layout
+        }
+        if not self.owner:
+            for array in self.arrays.values():
+                array.flags.writeable = False
+
+    @classmethod
+    def create(cls, arrays, min_size=0):
+        arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+        _, size = _layout(arrays)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, min_size, 1))
+        shared = cls(shm, [], owner=True)
+        shared.write(arrays)
+        return shared
+
+    def write(self, arrays):
+        """
+        Overwrites the block with new arrays (owner only). Returns False,
+        leaving the block untouched, if they do not fit.
+        """
+        arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+        layout, size = _layout(arrays)
+        if size > self.shm.size:
+            return False
+        self._map(layout)
+        for name, array in arrays.items():
+            self.arrays[name][...] = array
+        return True
+
+    @classmethod
+    def attach(cls, handle):
+        name, layout = handle
+        # multiprocessing children share the creator's resource tracker, so
+        # the block is only cleaned up by the creator (or if it leaks)
+        return cls(shared_memory.SharedMemory(name=name), layout, owner=False)
+
+    @property
+    def handle(self):
+        """Small picklable description to send to other processes."""
+        return self.shm.name, self.layout
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedCSRPool:
+    """
+    Producer side: a fixed number of reusable shared blocks for CSR batches.
+
+    Creating and unlinking a block per batch costs several system calls and
+    resource tracker messages, more than pickling a small batch. Blocks are
+    therefore kept and overwritten; one is only recreated (with headroom)
+    when a batch outgrows it. put() takes a free slot and release() returns
+    it once the consumer has replied, so at most ``slots`` batches are in
+    flight.
+    """
+
+    def __init__(self, slots=4):
+        self._blocks = [None] * slots
+        self._free = list(range(slots))
+
+    def put(self, matrix):
+        """Copies matrix into a free slot; returns (slot, handle)."""
+        if not self._free:
+            raise RuntimeError("no free slot: release() batches the consumer has finished")
+        matrix = csr_matrix(matrix)
+        arrays = {"data": matrix.data, "indices": matrix.indices, "indptr": matrix.indptr}
+        slot = self._free.pop()
+        block = self._blocks[slot]
+        if block is None or not block.write(arrays):
+            if block is not None:
+                block.unlink()
+            block = self._blocks[slot] = SharedArrays.create(arrays, min_size=2 * _layout(arrays)[1])
+        return slot, (block.handle, matrix.shape)
+
+    def release(self, slot):
+        self._free.append(slot)
+
+    def unlink(self):
+        for block in self._blocks:
+            if block is not None:
+                block.unlink()
+        self._blocks = [None] * len(self._blocks)
+
+
+class SharedCSRReader:
+    """
+    Consumer side: maps the blocks named in SharedCSRPool handles, keeping
+    up to ``max_blocks`` of them mapped, and returns CSR views over them.
+    """
+
+    def __init__(self, max_blocks=16):
+        self.max_blocks = max_blocks
+        self._blocks = OrderedDict()
+
+    def read(self, handle):
+        """
+        Returns a csr_matrix viewing the shared arrays. It is only valid
+        until its slot is released, so finish with it before replying.
+        """
+        (name, layout), shape = handle
+        shm = self._blocks.pop(name, None)
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=name)
+            if len(self._blocks) >= self.max_blocks:
+                # Blocks the producer replaced; views of them are gone by now
+                self._blocks.popitem(last=False)[1].close()
+        self._blocks[name] = shm
+        arrays = SharedArrays(shm, layout, owner=False)
+        return csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=shape, copy=False)
+
+    def close(self):
+        for shm in self._blocks.values():
+            shm.close()
+        self._blocks.clear()
+
+
+class SharedForest:
+    """
+    A fitted RandomForestClassifier flattened into shared node arrays.
+
+    All trees are concatenated; leaves point back to themselves with an
+    infinite threshold, so a batch is scored by stepping every (row, tree)
+    pair down max_depth levels at once. predict_proba() matches the
+    forest's own output.
+    """
+
+    def __init__(self, arrays, classes, max_depth):
+        self.arrays = arrays
+        self.classes_ = np.asarray(classes)
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_forest(cls, forest):
+        offset, roots, parts = 0, [], []
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count) + offset
+            leaf = tree.children_left < 0
+            value = tree.value[:, 0, :]
+            parts.append((
+                np.where(leaf, nodes, tree.children_left + offset),
+                np.where(leaf, nodes, tree.children_right + offset),
+                np.where(leaf, 0, tree.feature),
+                np.where(leaf, np.inf, tree.threshold),
+                value / value.sum(axis=1, keepdims=True),
+            ))
+            roots.append(offset)
+            offset += tree.node_count
+        left, right, feature, threshold, value = (np.concatenate(p) for p in zip(*parts))
+        arrays = SharedArrays.create({
+            "roots": np.array(roots, dtype=np.intp),
+            "left": left.astype(np.intp),
+            "right": right.astype(np.intp),
+            "feature": feature.astype(np.intp),
+            "threshold": threshold.astype(np.float64),
+            "value": value.astype(np.float64),
+        })
+        max_depth = max(e.tree_.max_depth for e in forest.estimators_)
+        return cls(arrays, forest.classes_, max_depth)
+
+    @classmethod
+    def attach(cls, handle):
+        arrays_handle, classes, max_depth = handle
+        return cls(SharedArrays.attach(arrays_handle), classes, max_depth)
+
+    @property
+    def handle(self):
+        return self.arrays.handle, self.classes_.tolist(), self.max_depth
+
+    def predict_proba(self, X):
+        a = self.arrays
+        # The trees compare float32 features, as sklearn does. Sparse batches
+        # are looked up in place: densifying a TF-IDF batch costs far more
+        # than the few entries each tree level reads.
+        if hasattr(X, "tocsr"):
+            lookup = _sparse_lookup(X)
+        else:
+            dense = np.asarray(X, dtype=np.float32)
+            lookup = lambda rows, cols: dense[rows, cols]
+        rows = np.arange(X.shape[0], dtype=np.int64)[:, None]
+        nodes = np.broadcast_to(a["roots"], (X.shape[0], len(a["roots"])))
+        for _ in range(self.max_depth):
+            go_left = lookup(rows, a["feature"][nodes]) <= a["threshold"][nodes]
+            nodes = np.where(go_left, a["left"][nodes], a["right"][nodes])
+        return a["value"][nodes].mean(axis=1)
+
+    def close(self):
+        self.arrays.close()
+
+    def unlink(self):
+        self.arrays.unlink()
+
+
+def share_models(classifier, heads=None):
+    """
+    Publishes the binary classifier and head models as SharedForests.
+
+    Returns:
+        dict: name -> SharedForest, with the classifier under 'is_threat'.
+    """
+    models = {"is_threat": classifier, **(heads or {})}
+    return {name: SharedForest.from_forest(model) for name, model in models.items()}
+
+
+def scoring_worker(model_handles, task_queue, result_queue):
+    """
+    Process target: maps the shared models once, then scores feature
+    batches sent as (slot, SharedCSRPool handle) until it receives None.
+
+    Puts (slot, {name: predict_proba array}) on result_queue; the producer
+    releases the slot when it gets the reply.
+    """
+    models = {name: SharedForest.attach(handle) for name, handle in model_handles.items()}
+    reader = SharedCSRReader()
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        slot, csr_handle = task
+        X = reader.read(csr_handle)
+        scores = {name: model.predict_proba(X) for name, model in models.items()}
+        del X
+        result_queue.put((slot, scores))
+    reader.close()
+    for model in models.values():
+        model.close()
+
+
+if __name__ == "__main__":
+    # Vectorize in this process, score in another over shared memory, and
+    # check the result against the in-process forest.
+    import multiprocessing as mp
+    import threat_detector
+
+    threat_detector.load_model_artifacts()
+    heads = threat_detector.load_head_models()
+    texts = ["ransomware encrypts files and demands bitcoin",
+             "security conference schedule announced",
+             "phishing emails steal bank credentials"] * 100
+    X = threat_detector.vectorize_batch(texts)
+
+    models = share_models(threat_detector.classifier_model, heads)
+    ctx = mp.get_context("spawn")
+    tasks, results = ctx.Queue(), ctx.Queue()
+    worker = ctx.Process(target=scoring_worker,
+                         args=({name: m.handle for name, m in models.items()}, tasks, results))
+    worker.start()
+    pool = SharedCSRPool()
+    tasks.put(pool.put(X))
+    slot, scores = results.get()
+    pool.release(slot)
+    tasks.put(None)
+    worker.join()
+    pool.unlink()
+
+    expected = {"is_threat": threat_detector.classifier_model.predict_proba(X),
+                **{name: head.predict_proba(X) for name, head in heads.items()}}
+    for name, proba in scores.items():
+        print(f"{name}: max |diff| vs in-process {np.abs(proba - expected[name]).max():.2e}")
+    for model in models.values():
+        model.unlink()
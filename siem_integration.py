@@ -3,6 +3,7 @@ import requests
 import json
 import os
 from dotenv import load_dotenv
+from utils import rate_limited, retry, RetryBudget, CircuitBreaker, CircuitOpenError
 
 load_dotenv()
 
@@ -14,6 +15,16 @@ if not SPLUNK_URL or not SPLUNK_TOKEN:
     raise ValueError("SPLUNK_URL and SPLUNK_TOKEN must be set in your .env")
 
 
+# Shared by every caller so a Splunk outage stops retries across threads
+splunk_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+
+@retry(max_retries=3, budget=RetryBudget(), breaker=splunk_breaker)
+@rate_limited(600, burst=20)
+def post_to_splunk(url, headers, payload):
+    response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=5)
+    response.raise_for_status()
+    return response
+
 def send_to_splunk(threat, index="threat_intel"):
     url = f"{SPLUNK_URL}/services/collector/event"
 
@@ -29,9 +40,8 @@ def send_to_splunk(threat, index="threat_intel"):
     }
     
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=5)
-        response.raise_for_status()
+        post_to_splunk(url, headers, payload)
         return True
-    except requests.RequestException as e:
+    except (requests.RequestException, CircuitOpenError) as e:
         print(f"Error sending to Splunk: {e}")
         return False
\ No newline at end of file
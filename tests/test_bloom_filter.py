@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from bloom_filter import BloomFilter
+
+
+@pytest.fixture
+def keys():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 2 ** 64, size=20_000, dtype=np.uint64, endpoint=False)
+
+
+def test_no_false_negatives(keys):
+    bloom = BloomFilter.for_capacity(len(keys), 0.01)
+    bloom.add_keys(keys)
+    assert bloom.might_contain_keys(keys).all()
+    assert all(bloom.might_contain_key(int(k)) for k in keys[:2000])
+
+
+def test_false_positive_rate_near_target(keys):
+    bloom = BloomFilter.for_capacity(len(keys), 0.01)
+    bloom.add_keys(keys[:10_000])
+    fp_rate = bloom.might_contain_keys(keys[10_000:]).mean()
+    assert fp_rate < 0.03
+
+
+def test_scalar_and_vectorized_paths_agree(keys):
+    bloom = BloomFilter.for_capacity(2000, 0.05)
+    bloom.add_keys(keys[:2000])
+    vectorized = bloom.might_contain_keys(keys)
+    scalar = np.array([bloom.might_contain_key(int(k)) for k in keys])
+    assert (vectorized == scalar).all()
+    assert not vectorized[2000:].all()  # some absent keys are rejected
+
+
+def test_save_load_mmap_round_trip(tmp_path, keys):
+    bloom = BloomFilter.for_capacity(5000)
+    bloom.add_keys(keys[:5000])
+    path = str(tmp_path / "bloom.npy")
+    bloom.save(path)
+
+    for mmap in (True, False):
+        loaded = BloomFilter.load(path, mmap=mmap)
+        assert (loaded.num_blocks, loaded.num_hashes, loaded.count) == (bloom.num_blocks, bloom.num_hashes, 5000)
+        assert (loaded.might_contain_keys(keys) == bloom.might_contain_keys(keys)).all()
+        assert loaded.might_contain_key(int(keys[0]))
+    mapped = BloomFilter.load(path)
+    assert isinstance(mapped.words, np.memmap) and not mapped.words.flags.writeable
+
+
+def test_load_missing_returns_none(tmp_path):
+    assert BloomFilter.load(str(tmp_path / "missing.npy")) is None
+
+
+def test_num_hashes_bounds():
+    with pytest.raises(ValueError):
+        BloomFilter(1, 0)
+    with pytest.raises(ValueError):
+        BloomFilter(1, 8)
@@ -0,0 +1,120 @@
+import os
+
+from change_log import (
+    ChangeLogReader, LiveThreatView, load_summary, open_live_view, publish_threats, rotated_path,
+    summary_path,
+)
+
+
+def _threats(n, threat_class="critical"):
+    return [{"source": "rss", "text": f"item {i}", "threat_class": threat_class,
+             "confidence": 0.5, "timestamp": None} for i in range(n)]
+
+
+def test_seeded_rows_dropped_on_first_delta(tmp_path):
+    path = str(tmp_path / "changes.jsonl")
+    reader = ChangeLogReader(path)
+    view = LiveThreatView()
+    view.seed(_threats(5, "suspicious"))
+    assert view.update(reader) == 0  # nothing published yet: demo rows stay
+    assert view.seeded and view.total == 5
+
+    publish_threats(_threats(3), path)
+    assert view.update(reader) == 3
+    assert not view.seeded
+    assert view.total == 3
+    assert view.metrics() == (3, 3, 0.5)
+    assert len(view.frame()) == 3
+
+    publish_threats(_threats(2), path)
+    view.update(reader)
+    assert view.total == 5  # later deltas append as usual
+
+
+def test_truncated_log_resets_view(tmp_path):
+    path = str(tmp_path / "changes.jsonl")
+    reader = ChangeLogReader(path)
+    view = LiveThreatView()
+    publish_threats(_threats(4), path)
+    view.update(reader)
+    open(path, "w").close()
+    publish_threats(_threats(1), path)
+    view.update(reader)
+    assert reader.reset and view.total == 1
+
+
+def test_reader_finishes_rotated_segment(tmp_path):
+    path = str(tmp_path / "changes.jsonl")
+    reader = ChangeLogReader(path)
+    view = LiveThreatView()
+    publish_threats(_threats(3), path)
+    view.update(reader)
+    publish_threats(_threats(2), path)  # unread, then rotated away
+    publish_threats(_threats(4), path, max_bytes=1)
+    assert os.path.exists(rotated_path(path))
+    assert view.update(reader) == 2  # rest of the old segment first
+    assert view.update(reader) == 4
+    assert not reader.reset and view.total == 9
+
+
+def test_double_rotation_resets(tmp_path):
+    path = str(tmp_path / "changes.jsonl")
+    reader = ChangeLogReader(path)
+    view = LiveThreatView()
+    publish_threats(_threats(3), path, max_bytes=1)
+    view.update(reader)
+    publish_threats(_threats(2), path, max_bytes=1)
+    publish_threats(_threats(1), path, max_bytes=1)  # the segment read from is gone
+    view.update(reader)
+    assert reader.reset and view.total == 1
+
+
+def test_new_session_starts_from_summary(tmp_path):
+    path = str(tmp_path / "changes.jsonl")
+    for _ in range(20):
+        publish_threats(_threats(50, "suspicious"), path)
+    publish_threats(_threats(10), path)
+    line = os.path.getsize(path) // 1010
+
+    view, reader = open_live_view(path, start_bytes=30 * line)
+    assert view.total == 1010
+    assert view.metrics() == (1010, 10, 0.5)
+    assert view.source_counts == {"rss": 1010}
+    assert 25 <= len(view.frame()) <= 31  # only the tail is replayed
+    assert view.recent(10)["threat_class"].eq("critical").all()
+
+    publish_threats(_threats(5), path)
+    assert view.update(reader) == 5
+    assert view.metrics(["critical"]) == (15, 15, 0.5)
+
+
+def test_new_session_without_summary_replays_segment(tmp_path):
+    path = str(tmp_path / "changes.jsonl")
+    publish_threats(_threats(3), path)
+    os.remove(summary_path(path))
+    view, reader = open_live_view(path)
+    assert view.total == 0 and reader.cursor == 0
+    assert view.update(reader) == 3 and view.total == 3
+
+
+def test_summary_matches_view_counters(tmp_path):
+    path = str(tmp_path / "changes.jsonl")
+    reader = ChangeLogReader(path)
+    view = LiveThreatView()
+    for threat_class in ("critical", "benign", "suspicious"):
+        publish_threats(_threats(4, threat_class), path, max_bytes=500)  # rotates each time
+        view.update(reader)
+    assert os.path.exists(rotated_path(path)) and not reader.reset
+    summary = load_summary(path)
+    assert summary["total"] == view.total == 12
+    assert summary["class_counts"] == dict(view.class_counts)
+    assert summary["class_confidence"] == dict(view.class_confidence)
+    assert summary["offset"] == os.path.getsize(path) == reader.cursor
+
+
+def test_max_rows_drops_old_chunks_but_keeps_counters():
+    view = LiveThreatView(max_rows=10)
+    for _ in range(5):
+        view.apply(_threats(4))
+    assert view.total == 20 and view.metrics() == (20, 20, 0.5)
+    assert view.rows == len(view.frame()) == len(view.recent(100)) == 10
@@ -0,0 +1,40 @@
+import pytest
+
+from html_extractor import SITE_CONFIGS, SiteExtractor
+from tor_crawler import FingerprintStore
+
+PAGE = """<html><body><span class="age">{age} mins ago</span>
+<div class="question-summary"><a class="question-hyperlink" href="/q/1">{title}</a>
+<span class="relativetime" title="2025-01-01 00:00:00Z">x</span></div>
+</body></html>"""
+
+
+def extractor(parser="html.parser"):
+    return SiteExtractor(SITE_CONFIGS["security_stackexchange"], parser=parser)
+
+
+def test_unchanged_posts_are_skipped_despite_page_chrome():
+    store = FingerprintStore(path=None)
+    first = extractor().extract(PAGE.format(age=1, title="Zero-day"), url="u", fingerprints=store)
+    assert [item["text"] for item in first] == ["Zero-day"]
+    assert extractor().extract(PAGE.format(age=7, title="Zero-day"), url="u", fingerprints=store) == []
+    changed = extractor().extract(PAGE.format(age=9, title="Ransomware"), url="u", fingerprints=store)
+    assert [item["text"] for item in changed] == ["Ransomware"]
+
+
+def test_failed_extraction_is_not_recorded():
+    store = FingerprintStore(path=None)
+    broken = extractor()
+    broken.fields = None  # makes extraction raise after parsing
+    with pytest.raises(AttributeError):
+        broken.extract(PAGE.format(age=1, title="Zero-day"), url="u", fingerprints=store)
+    retried = extractor().extract(PAGE.format(age=1, title="Zero-day"), url="u", fingerprints=store)
+    assert len(retried) == 1
+
+
+def test_posts_without_required_text_are_skipped():
+    page = """<div class="question-summary"><span class="relativetime" title="t">x</span></div>
+<div class="question-summary"><a class="question-hyperlink" href="/q/2"></a></div>
+<div class="question-summary"><a class="question-hyperlink">Phishing kit</a></div>"""
+    items = extractor().extract(page)
+    assert items == [{"source": "security_forum", "text": "Phishing kit", "timestamp": None, "url": None}]
@@ -0,0 +1,91 @@
+import os
+import time
+
+import pytest
+
+import sharded_pipeline
+from sharded_pipeline import DroppedBatchesError, iter_sharded, run_sharded
+
+# Fake workers replace _worker_main; the fork start method lets them be
+# patched in without re-importing the module in the child.
+
+
+def _echo_worker(worker_id, task_queue, result_queue, multihead, ioc_index_path):
+    result_queue.put((worker_id, None, None, None))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        batch_id, items = task
+        result_queue.put((worker_id, batch_id, [dict(item, analyzed=True) for item in items], None))
+
+
+def _dies_on_startup(worker_id, task_queue, result_queue, multihead, ioc_index_path):
+    os._exit(3)
+
+
+def _fails_to_load(worker_id, task_queue, result_queue, multihead, ioc_index_path):
+    result_queue.put((worker_id, None, None, "FileNotFoundError('threat_classifier.joblib')"))
+
+
+def _dies_on_every_batch(worker_id, task_queue, result_queue, multihead, ioc_index_path):
+    result_queue.put((worker_id, None, None, None))
+    task_queue.get()
+    time.sleep(0.1)  # os._exit skips flushing the handshake still in the queue's buffer
+    os._exit(1)
+
+
+ITEMS = [{"id": i} for i in range(10)]
+
+
+def test_results_keep_input_order(monkeypatch):
+    monkeypatch.setattr(sharded_pipeline, "_worker_main", _echo_worker)
+    analyzed = run_sharded(ITEMS, workers=3, batch_size=2, start_method="fork")
+    assert [item["id"] for item in analyzed] == list(range(10))
+    assert all(item["analyzed"] for item in analyzed)
+
+
+@pytest.mark.parametrize("worker", [_dies_on_startup, _fails_to_load])
+def test_worker_failing_at_startup_aborts(monkeypatch, worker):
+    monkeypatch.setattr(sharded_pipeline, "_worker_main", worker)
+    with pytest.raises(RuntimeError):
+        run_sharded(ITEMS, workers=2, batch_size=2, start_method="fork")
+
+
+def test_repeated_crashes_abort(monkeypatch):
+    monkeypatch.setattr(sharded_pipeline, "_worker_main", _dies_on_every_batch)
+    with pytest.raises(RuntimeError, match="worker crashes"):
+        run_sharded(ITEMS, workers=2, batch_size=2, start_method="fork", max_crashes=4)
+
+
+def _fails_on_odd_ids(worker_id, task_queue, result_queue, multihead, ioc_index_path):
+    result_queue.put((worker_id, None, None, None))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        batch_id, items = task
+        if any(item["id"] % 2 for item in items):
+            result_queue.put((worker_id, batch_id, None, "ValueError('bad item')"))
+        else:
+            result_queue.put((worker_id, batch_id, [dict(item, analyzed=True) for item in items], None))
+
+
+def test_dropped_batches_are_reported(monkeypatch):
+    monkeypatch.setattr(sharded_pipeline, "_worker_main", _fails_on_odd_ids)
+    items = [{"id": i} for i in (0, 2, 4, 5, 6, 8, 9, 10)]
+    with pytest.raises(DroppedBatchesError, match="2 batches") as excinfo:
+        run_sharded(items, workers=2, batch_size=2, start_method="fork", max_attempts=2)
+    error = excinfo.value
+    assert sorted(error.failed) == [1, 3]
+    assert error.failed_items == [{"id": 4}, {"id": 5}, {"id": 9}, {"id": 10}]
+    assert [item["id"] for item in error.analyzed] == [0, 2, 6, 8]
+
+
+def test_iter_sharded_yields_other_batches_before_raising(monkeypatch):
+    monkeypatch.setattr(sharded_pipeline, "_worker_main", _fails_on_odd_ids)
+    seen = []
+    with pytest.raises(DroppedBatchesError):
+        for item in iter_sharded([{"id": i} for i in (1, 2, 4)], workers=1, batch_size=1, start_method="fork"):
+            seen.append(item["id"])
+    assert seen == [2, 4]
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, random as sparse_random
+from sklearn.ensemble import RandomForestClassifier
+
+from shared_features import SharedForest
+
+
+@pytest.fixture(scope="module")
+def fitted():
+    rng = np.random.default_rng(0)
+    X = sparse_random(300, 50, density=0.1, format="csr", random_state=0, dtype=np.float64)
+    y = (X[:, :5].sum(axis=1).A1 > 0.2).astype(int) + (X[:, 10].toarray().ravel() > 0.5)
+    forest = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y)
+    shared = SharedForest.from_forest(forest)
+    yield forest, shared, X, rng
+    shared.unlink()
+
+
+def test_sparse_matches_forest(fitted):
+    forest, shared, X, _ = fitted
+    np.testing.assert_allclose(shared.predict_proba(X), forest.predict_proba(X), atol=1e-12)
+
+
+def test_dense_matches_forest(fitted):
+    forest, shared, X, _ = fitted
+    dense = X.toarray()
+    np.testing.assert_allclose(shared.predict_proba(dense), forest.predict_proba(dense), atol=1e-12)
+
+
+def test_non_canonical_and_empty_rows(fitted):
+    forest, shared, X, rng = fitted
+    # Every row's entries split into two duplicates, in shuffled column order
+    indptr, indices, data = [0], [], []
+    for row in X[:40]:
+        order = rng.permutation(2 * row.nnz)
+        indices.extend(np.tile(row.indices, 2)[order])
+        data.extend(np.tile(row.data / 2, 2)[order])
+        indptr.append(len(indices))
+    messy = csr_matrix((data, indices, indptr), shape=(40, X.shape[1]))
+    assert not messy.has_canonical_format
+    np.testing.assert_allclose(shared.predict_proba(messy), forest.predict_proba(X[:40]), atol=1e-12)
+
+    empty = csr_matrix((3, X.shape[1]))
+    np.testing.assert_allclose(shared.predict_proba(empty), forest.predict_proba(empty), atol=1e-12)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import threat_detector
+from threat_detector import TRIAGE_MARGIN, THREAT_CLASS_CUTS, distill_forest, distilled_proba, triage_proba
+
+TEXTS = [
+    "ransomware encrypts files and demands bitcoin",
+    "phishing emails steal bank credentials",
+    "zero day vulnerability in popular web server",
+    "security conference schedule announced",
+    "new version of machine learning library released",
+    "firewall patches released next week",
+] * 5
+LABELS = [1, 1, 1, 0, 0, 0] * 5
+
+
+def _fitted():
+    vectorizer = TfidfVectorizer().fit(TEXTS)
+    forest = RandomForestClassifier(n_estimators=20, random_state=0).fit(vectorizer.transform(TEXTS), LABELS)
+    return vectorizer, forest
+
+
+def test_margin_covers_transfer_set_quantile():
+    vectorizer, forest = _fitted()
+    student = distill_forest(vectorizer, forest, TEXTS, copies=5, quantile=0.9)
+    X = vectorizer.transform(TEXTS)
+    gap = np.abs(distilled_proba(student, X) - forest.predict_proba(X)[:, 1])
+    assert 0 < student.triage_margin_ < 1
+    assert student.triage_margin_ >= np.quantile(gap, 0.5)
+
+
+def test_triage_uses_the_students_margin():
+    vectorizer, forest = _fitted()
+    student = distill_forest(vectorizer, forest, TEXTS, copies=5)
+    X = vectorizer.transform(TEXTS)
+    _, escalated = triage_proba(student, forest, X)
+    student_p = distilled_proba(student, X)
+    near_cut = np.zeros(len(TEXTS), dtype=bool)
+    for cut in THREAT_CLASS_CUTS:
+        near_cut |= np.abs(student_p - cut) < student.triage_margin_
+    assert (escalated == near_cut).all()
+
+    del student.triage_margin_  # saved before margins were measured
+    _, escalated = triage_proba(student, forest, X)
+    near_cut[:] = False
+    for cut in THREAT_CLASS_CUTS:
+        near_cut |= np.abs(student_p - cut) < TRIAGE_MARGIN
+    assert (escalated == near_cut).all()
+
+
+@pytest.fixture
+def scratch_models(tmp_path, monkeypatch):
+    # Module state pointed at fresh artifact paths; restored afterwards
+    for name in ("VECTORIZER_PATH", "CLASSIFIER_PATH", "HEADS_PATH", "DISTILLED_PATH"):
+        monkeypatch.setattr(threat_detector, name, str(tmp_path / f"{name.lower()}.joblib"))
+    for name in ("vectorizer_model", "classifier_model", "token_vectorizer_model",
+                 "vectorizer_fingerprint", "head_models", "distilled_model"):
+        monkeypatch.setattr(threat_detector, name, None)
+    monkeypatch.setattr(threat_detector, "_stale_warned", set())
+    threat_detector.train_and_save_model(TEXTS, LABELS)
+    threat_detector.load_model_artifacts()
+    return threat_detector
+
+
+def _retrain_vectorizer(td):
+    # As load_model_artifacts does when vectorizer.joblib is missing
+    td.train_and_save_model(TEXTS + ["cloud webinar on quantum computing trends"], LABELS + [0])
+    td.vectorizer_model = td.classifier_model = None
+    td.load_model_artifacts()
+
+
+def _items():
+    return [{"text": t, "clean_text": t} for t in TEXTS[:6]]
+
+
+def test_heads_from_another_vectorizer_are_ignored(scratch_models):
+    td = scratch_models
+    td.train_and_save_heads(TEXTS, {"severity": LABELS})
+    assert "severity" in td.analyze_data(_items(), multihead=True)[0]
+
+    _retrain_vectorizer(td)
+    assert td.load_head_models() is None
+    analyzed = td.analyze_data(_items(), multihead=True)
+    assert "severity" not in analyzed[0] and "is_threat" in analyzed[0]
+
+
+def test_student_from_another_vectorizer_falls_back_to_forest(scratch_models):
+    td = scratch_models
+    td.train_and_save_distilled(TEXTS)
+    assert "escalated" in td.predict_threat(TEXTS[0], two_tier=True)
+
+    _retrain_vectorizer(td)
+    assert td.load_distilled_model() is None
+    prediction = td.predict_threat(TEXTS[0], two_tier=True)
+    assert "escalated" not in prediction and prediction["threat_class"] != "unknown"
+    assert all("escalated" not in p for p in td.analyze_data(_items(), two_tier=True))
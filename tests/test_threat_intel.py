@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import threat_intel
+from threat_intel import IOCIndex, sync_otx
+from utils import retry
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Cybersecurity_Dataset.csv")
+
+
+def _pulses(*indicators):
+    return lambda watermark, page_size: iter([{
+        "modified": "2025-06-01T00:00:00",
+        "indicators": [{"indicator": i} for i in indicators],
+    }])
+
+
+def test_fresh_index_is_seeded_from_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(threat_intel, "iter_subscribed_pulses", _pulses("evil.example.com"))
+    state_path, index_path = str(tmp_path / "state.json"), str(tmp_path / "index.npy")
+    sync_otx(None, state_path, index_path, dataset_path=DATASET)
+
+    index = IOCIndex.load(index_path)
+    assert "evil.example.com" in index
+    assert "infected.exe" in index  # from the dataset's IOC column
+
+
+def test_existing_index_is_not_reseeded(tmp_path, monkeypatch):
+    monkeypatch.setattr(threat_intel, "iter_subscribed_pulses", _pulses())
+    state_path, index_path = str(tmp_path / "state.json"), str(tmp_path / "index.npy")
+    existing = IOCIndex()
+    existing.add("known.example.com")
+    existing.save(index_path)
+    sync_otx(None, state_path, index_path, dataset_path=DATASET)
+
+    index = IOCIndex.load(index_path)
+    assert "known.example.com" in index
+    assert "infected.exe" not in index
+
+
+TEXTS = [
+    "Beacon to EVIL.example.com and 10.0.2.4 dropping infected.exe, also 8.8.8.8",
+    "nothing to see here",
+    "CVE-2021-44228 exploited from 10.0.2.4",
+]
+
+
+def test_keys_match_scalar_key():
+    iocs = ["10.0.2.4", " Evil.Example.com ", "infected.exe"]
+    assert IOCIndex.keys(iocs).tolist() == [IOCIndex.key(i) for i in iocs]
+    assert len(IOCIndex.keys([])) == 0
+
+
+def test_match_batch_same_before_and_after_save(tmp_path):
+    index = IOCIndex()
+    index.update(["evil.example.com", "10.0.2.4", "CVE-2021-44228"])
+    expected = [["EVIL.example.com", "10.0.2.4"], [], ["CVE-2021-44228", "10.0.2.4"]]
+    assert index.match_batch(TEXTS) == expected
+
+    path = str(tmp_path / "index.npy")
+    index.save(path)
+    loaded = IOCIndex.load(path)
+    assert loaded.match_batch(TEXTS) == expected
+    assert [loaded.match_text(t) for t in TEXTS] == expected
+    assert [("10.0.2.4" in loaded), ("8.8.8.8" in loaded)] == [True, False]
+    assert IOCIndex.load(str(tmp_path / "empty.npy")).match_batch(TEXTS) == [[], [], []]
+
+
+def test_enrich_threat_data(tmp_path):
+    index = IOCIndex()
+    index.update(["infected.exe"])
+    path = str(tmp_path / "index.npy")
+    index.save(path)
+    enriched = threat_intel.enrich_threat_data({"text": TEXTS[0]}, IOCIndex.load(path))
+    assert enriched["iocs"] == ["EVIL.example.com", "10.0.2.4", "infected.exe", "8.8.8.8"]
+    assert enriched["ioc_matches"] == ["infected.exe"]
+
+
+def _pulse(i, day):
+    return {"id": f"pulse{i}", "modified": f"2025-06-{day:02d}T00:00:00",
+            "indicators": [{"indicator": f"10.0.{i}.{j}"} for j in range(3)]}
+
+
+@pytest.fixture
+def mock_otx(tmp_path, monkeypatch):
+    """
+    A local OTX server paging through ``server.pulses``; requests for a page
+    in ``server.failing_pages`` get a 500.
+    """
+    class MockOTX(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            since = query.get("modified_since", [""])[0]
+            limit = int(query["limit"][0])
+            page = int(query.get("page", [1])[0])
+            server.requests.append(page)
+            if page in server.failing_pages:
+                self.send_response(500)
+                self.end_headers()
+                return
+            matching = [p for p in server.pulses if p["modified"] > since]
+            more = page * limit < len(matching)
+            next_url = (f"{base_url}/api/v1/pulses/subscribed?limit={limit}&page={page + 1}"
+                        f"&modified_since={since}") if more else None
+            body = json.dumps({"results": matching[(page - 1) * limit:page * limit], "next": next_url})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockOTX)
+    server.pulses, server.failing_pages, server.requests = [], set(), []
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(threat_intel, "OTX_BASE_URL", base_url)
+    # Same retries, without the one-call-per-second rate limit and the backoff waits
+    unlimited = threat_intel._get_otx_json.__wrapped__.__wrapped__
+    monkeypatch.setattr(threat_intel, "_get_otx_json", retry(max_retries=3, backoff_factor=0)(unlimited))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _sync(tmp_path):
+    state_path, index_path = str(tmp_path / "state.json"), str(tmp_path / "index.npy")
+    index = sync_otx(None, state_path, index_path, page_size=3, dataset_path=DATASET)
+    with open(state_path) as f:
+        return index, json.load(f)
+
+
+def test_sync_follows_pages(tmp_path, mock_otx):
+    mock_otx.pulses = [_pulse(i, i + 1) for i in range(7)]
+    index, state = _sync(tmp_path)
+    assert mock_otx.requests == [1, 2, 3]
+    assert all(f"10.0.{i}.2" in index for i in range(7))
+    assert state["modified_since"] == "2025-06-07T00:00:00"
+    assert state["indicators"] == len(index)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_incremental_sync_fetches_only_newer_pulses(tmp_path, mock_otx):
+    mock_otx.pulses = [_pulse(i, i + 1) for i in range(4)]
+    _, first = _sync(tmp_path)
+    mock_otx.pulses.append(_pulse(9, 20))
+    mock_otx.requests.clear()
+    index, state = _sync(tmp_path)
+    assert mock_otx.requests == [1]  # a single page holds the one newer pulse
+    assert "10.0.9.0" in index and "10.0.0.0" in index  # earlier pulses kept from disk
+    assert state["modified_since"] == "2025-06-20T00:00:00"
+    assert state["indicators"] == first["indicators"] + 3
+
+
+def test_interrupted_sync_keeps_old_watermark(tmp_path, mock_otx):
+    mock_otx.pulses = [_pulse(i, i + 1) for i in range(2)]
+    _sync(tmp_path)
+    mock_otx.pulses += [_pulse(i, i + 10) for i in range(2, 9)]
+    mock_otx.failing_pages = {2}
+    index, state = _sync(tmp_path)
+    assert mock_otx.requests[-3:] == [2, 2, 2]  # retried, then given up
+    assert "10.0.2.0" in index  # the first page was still saved
+    assert state["modified_since"] == "2025-06-02T00:00:00"
+
+    mock_otx.failing_pages.clear()
+    index, state = _sync(tmp_path)  # redoes everything after the old watermark
+    assert all(f"10.0.{i}.2" in index for i in range(9))
+    assert state["modified_since"] == "2025-06-18T00:00:00"
@@ -0,0 +1,118 @@
+import copy
+from datetime import datetime, timezone
+
+import pytest
+
+from threat_stats import CountMinSketch, HeavyHitters, RollingCounter, ThreatStats
+
+START = 1_750_000_020  # a bucket boundary for 60 s buckets
+
+
+def _item(t, source="rss", actor="group1", keyword="ransomware"):
+    return {"source": source, "threat_class": "critical",
+            "timestamp": datetime.fromtimestamp(t, timezone.utc).isoformat(),
+            "entities": {"orgs": [actor], "threats": [keyword]}}
+
+
+def _steady(stats, minutes, per_minute=10, start=START, **keys):
+    spikes = []
+    for minute in range(minutes):
+        t = start + minute * 60
+        spikes += stats.update([_item(t + 1, **keys) for _ in range(per_minute)], now=t + 59)
+    return spikes
+
+
+def test_ring_advance_drops_buckets_leaving_the_window():
+    counter = RollingCounter(buckets=5)
+    for bucket in range(5):
+        counter.add(bucket, bucket + 1)
+    assert counter.series() == [1, 2, 3, 4, 5] and counter.total == 15
+    counter.add(7, 10)  # buckets 0-2 leave the window
+    assert counter.series() == [4, 5, 0, 0, 10] and counter.total == 19
+    assert counter.closed == 7
+
+
+def test_long_gap_folds_into_baseline():
+    jumped = RollingCounter(buckets=60)
+    for bucket in range(100):
+        jumped.add(bucket, 10 + bucket % 3)
+    stepped = copy.deepcopy(jumped)
+    jumped.advance(600)
+    for bucket in range(100, 601):
+        stepped.advance(bucket)
+    assert jumped.slots == stepped.slots and jumped.total == stepped.total == 0
+    assert jumped.closed == stepped.closed
+    assert jumped.mean == pytest.approx(stepped.mean)
+    # Beyond one window the variance is only decayed, which slightly understates it
+    assert 0.5 * stepped.var <= jumped.var <= stepped.var
+
+
+def test_late_and_out_of_window_items():
+    counter = RollingCounter(buckets=5)
+    assert counter.add(10) == 1
+    assert counter.add(10) == 2
+    assert counter.add(8) is None  # late but inside the window: counted
+    assert counter.total == 3
+    assert counter.add(5) is None  # too old for the window: dropped
+    assert counter.total == 3 and counter.bucket == 10
+
+
+def test_spike_fires_once_per_key_and_bucket():
+    stats = ThreatStats()
+    assert _steady(stats, 30) == []
+    t = START + 30 * 60
+    burst = [_item(t + 1, source="darkweb", actor="group42") for _ in range(60)]
+    spikes = stats.update(burst[:30], now=t + 30) + stats.update(burst[30:], now=t + 40)
+    fired = {(s["dimension"], s["key"]) for s in spikes}
+    assert ("all", "all") in fired
+    assert len(spikes) == len(fired)
+
+
+def test_sketch_decays_once_per_elapsed_window():
+    stats = ThreatStats()
+    _steady(stats, 1, per_minute=1000)
+    assert stats.sketches["actor"].estimate("group1") == 1000
+    window = stats.bucket_seconds * stats.window_buckets
+    later = START + 59 + 10 * window + 30
+    stats.update([], now=later)
+    assert stats.sketches["actor"].estimate("group1") == 1000 >> 10
+    assert stats.heavy["actor"].top() == []  # 1000 >> 10 == 0
+    assert stats.last_decay == START + 59 + 10 * window  # the leftover 30 s count toward the next one
+
+
+def test_decay_saturates_at_bit_width():
+    sketch = CountMinSketch(width=16, depth=2)
+    sketch.add("key", 2 ** 62)
+    sketch.decay(1000)
+    assert sketch.estimate("key") == 0
+    heavy = HeavyHitters(candidates={"key": 2 ** 62})
+    heavy.decay(1000)
+    assert heavy.counts == {}
+
+
+def test_save_load_round_trip(tmp_path):
+    stats = ThreatStats()
+    _steady(stats, 20, source="forum")
+    state_path, snapshot_path = str(tmp_path / "state.json"), str(tmp_path / "snapshot.json")
+    stats.save(state_path, snapshot_path)
+    restored = ThreatStats.load(state_path)
+
+    before, after = stats.snapshot(), restored.snapshot()
+    for key in ("window_total", "series", "windows", "top", "spikes"):
+        assert after[key] == before[key]
+    assert restored.last_decay == stats.last_decay
+    assert restored.overall.to_dict() == stats.overall.to_dict()
+
+    # Both continue identically
+    start = START + 20 * 60
+    assert _steady(restored, 5, start=start) == _steady(stats, 5, start=start)
+    assert restored.snapshot()["windows"] == stats.snapshot()["windows"]
+
+
+def test_load_with_other_layout_starts_fresh(tmp_path):
+    stats = ThreatStats()
+    _steady(stats, 2)
+    state_path = str(tmp_path / "state.json")
+    stats.save(state_path, str(tmp_path / "snapshot.json"))
+    fresh = ThreatStats.load(state_path, window_buckets=30)
+    assert fresh.overall.bucket is None
@@ -0,0 +1,42 @@
+from tor_crawler import SessionPool
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(size=1):
+    return SessionPool(size=size, proxy_host=None, session_factory=FakeSession)
+
+
+def test_rotate_keeps_leased_session_open_until_released():
+    pool = make_pool()
+    with pool.lease("a.onion") as (slot, generation, session):
+        assert pool.rotate(slot, generation)
+        assert not session.closed
+        with pool.lease("a.onion") as (_, _, fresh):
+            assert fresh is not session
+    assert session.closed
+    assert not fresh.closed
+
+
+def test_rotate_skips_when_generation_moved_on():
+    pool = make_pool()
+    with pool.lease("a.onion") as (slot, first, _):
+        with pool.lease("b.onion") as (_, second, _):
+            assert first == second
+            assert pool.rotate(slot, first)
+            assert not pool.rotate(slot, second)
+    assert pool._generations[slot] == 1
+
+
+def test_rotate_idle_session_closes_immediately():
+    pool = make_pool()
+    with pool.lease("a.onion") as (slot, generation, session):
+        pass
+    assert pool.rotate(slot, generation)
+    assert session.closed
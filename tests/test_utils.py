@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from requests.exceptions import RequestException
+
+from utils import CircuitBreaker, CircuitOpenError, RetryBudget, host_key, rate_limited, retry
+
+RATE, BURST = 20, 5  # per second, per host
+URLS = [f"https://host{i % 2}.example/item/{i}" for i in range(80)]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _worst_window(stamps):
+    stamps = sorted(stamps)
+    return max(sum(1 for t in stamps if s <= t < s + 1.0) for s in stamps)
+
+
+def _record(calls, lock, url):
+    with lock:
+        calls.setdefault(host_key(url), []).append(time.monotonic())
+
+
+def test_rate_limit_threads():
+    calls, lock = {}, threading.Lock()
+
+    @rate_limited(RATE * 60, key=host_key, burst=BURST)
+    def fetch(url):
+        _record(calls, lock, url)
+
+    with ThreadPoolExecutor(max_workers=50) as pool:
+        list(pool.map(fetch, URLS))
+
+    assert sorted(calls) == ["host0.example", "host1.example"]
+    for stamps in calls.values():
+        assert len(stamps) == 40
+        assert _worst_window(stamps) <= RATE + BURST
+
+
+def test_rate_limit_asyncio():
+    calls, lock = {}, threading.Lock()
+
+    @rate_limited(RATE * 60, key=host_key, burst=BURST)
+    async def fetch(url):
+        _record(calls, lock, url)
+
+    async def run():
+        await asyncio.gather(*(fetch(url) for url in URLS))
+    asyncio.run(run())
+
+    for stamps in calls.values():
+        assert len(stamps) == 40
+        assert _worst_window(stamps) <= RATE + BURST
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, initial=1, max_tokens=2)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    for _ in range(10):
+        budget.deposit()
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_breaker_transitions():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # one trial at a time
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_retry_opens_breaker_and_spends_budget():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    calls = []
+
+    @retry(max_retries=5, backoff_factor=0, jitter=False, breaker=breaker, budget=RetryBudget(initial=1))
+    def flaky():
+        calls.append(1)
+        raise RequestException("service down")
+
+    with pytest.raises(RequestException):
+        flaky()
+    assert len(calls) == 2  # the budget allowed one retry
+    with pytest.raises(RequestException):
+        flaky()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        flaky()
+    assert len(calls) == 3
+
+
+def test_breaker_recovers_from_unexpected_trial_error():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    outcome = [ValueError("bad payload")]
+
+    @retry(max_retries=1, breaker=breaker)
+    def call():
+        if outcome:
+            raise outcome.pop()
+        return "ok"
+
+    breaker.record_failure()
+    clock.now = 10
+    with pytest.raises(ValueError):
+        call()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        call()
+    clock.now = 20
+    assert call() == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_recovers_from_cancelled_trial():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+
+    @retry(max_retries=1, breaker=breaker)
+    async def call(delay):
+        await asyncio.sleep(delay)
+        return "ok"
+
+    async def run():
+        task = asyncio.create_task(call(60))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert breaker.state == CircuitBreaker.OPEN
+        clock.now = 20
+        return await call(0)
+
+    breaker.record_failure()
+    clock.now = 10
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_trial_that_never_reports_back():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()  # the trial call is lost without reporting
+    clock.now = 15
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
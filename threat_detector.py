@@ -2,18 +2,76 @@
 #  identifies and classifies potential cyber threats within textual data using machine learning.
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from scipy.sparse import vstack
+from scipy.special import expit
+from functools import partial
+import copy
+import hashlib
 import joblib
 import numpy as np
 import os
+import random
 
 # Define file paths for model artifacts
 VECTORIZER_PATH = "vectorizer.joblib"
 CLASSIFIER_PATH = "threat_classifier.joblib"
+HEADS_PATH = "threat_heads.joblib"
+DISTILLED_PATH = "distilled_classifier.joblib"
+# Trees per head; heads share the binary classifier's features
+HEAD_ESTIMATORS = 50
+# Two-tier scoring: the distilled linear model's threat probability is kept
+# unless it lies within the student's triage margin of a threat_class cut
+# point, in which case the item is escalated to the forest. The margin is
+# measured during distillation (TRIAGE_QUANTILE of the student-forest
+# difference); TRIAGE_MARGIN is the fallback for students saved without one
+TRIAGE_MARGIN = 0.1
+TRIAGE_QUANTILE = 0.99
+THREAT_CLASS_CUTS = (0.5, 0.7)
 
 # Global variables to hold the loaded model and vectorizer
 # These will be loaded once when the module is initialized (or first accessed)
 vectorizer_model = None
 classifier_model = None
+# feature_fingerprint(vectorizer_model); models fitted on its features store
+# it as feature_fingerprint_ so stale ones are caught on load
+vectorizer_fingerprint = None
+# Copy of vectorizer_model that accepts the token lists cached by
+# data_processor.normalize_text instead of raw strings (see get_token_vectorizer)
+token_vectorizer_model = None
+# Multi-head classifiers keyed by head name (see load_head_models)
+head_models = None
+# Artifact paths already reported as not matching vectorizer_model
+_stale_warned = set()
+# Linear student of classifier_model (see load_distilled_model)
+distilled_model = None
+
+# TfidfVectorizer's default token_pattern; only vectorizers using it can
+# safely reuse our tokens
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+def feature_fingerprint(vectorizer):
+    """
+    Hash of a fitted vectorizer's vocabulary (in column order) and IDF
+    weights: models fitted on its output are only valid while it matches.
+    """
+    terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    digest = hashlib.sha256("\n".join(terms).encode())
+    idf = getattr(vectorizer, "idf_", None)
+    if idf is not None:
+        digest.update(np.asarray(idf, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def _fits_vectorizer(models, path):
+    # Models fitted on another vectorizer's features would fail on (or
+    # silently mis-score) its matrices; warn once per artifact
+    if all(getattr(m, "feature_fingerprint_", None) == vectorizer_fingerprint for m in models):
+        return True
+    if path not in _stale_warned:
+        _stale_warned.add(path)
+        print(f"WARNING: {path} was trained on different features than {VECTORIZER_PATH}; "
+              f"ignoring it until it is retrained (see train_model.py).")
+    return False
 
 def train_and_save_model(train_texts, train_labels):
     """
@@ -40,7 +98,7 @@ def load_model_artifacts():
     This function should be called once when the application starts or
     when the module is first used.
     """
-    global vectorizer_model, classifier_model # Declare intent to modify global variables
+    global vectorizer_model, classifier_model, token_vectorizer_model, vectorizer_fingerprint # Declare intent to modify global variables
     
     if vectorizer_model is None or classifier_model is None:
         if not os.path.exists(VECTORIZER_PATH) or not os.path.exists(CLASSIFIER_PATH):
@@ -66,23 +124,251 @@ def load_model_artifacts():
             print("Loading model artifacts...")
             vectorizer_model = joblib.load(VECTORIZER_PATH)
             classifier_model = joblib.load(CLASSIFIER_PATH)
+            token_vectorizer_model = None # Rebuilt lazily for the new vectorizer
+            vectorizer_fingerprint = feature_fingerprint(vectorizer_model)
+            _stale_warned.clear()
             print("Model artifacts loaded successfully.")
         except Exception as e:
             print(f"ERROR: Could not load model artifacts: {e}")
             vectorizer_model = None
             classifier_model = None # Ensure they are None if loading fails
 
-def predict_threat(text):
+def _analyze_tokens(tokens, ngram_range=(1, 1), stop_words=frozenset()):
     """
-    Predicts if a given text is a threat using the loaded models.
-    Assumes load_model_artifacts() has been called.
+    Reproduces TfidfVectorizer's word analyzer on pre-split tokens.
+
+    Text cleaned by data_processor contains only lowercase ASCII letters,
+    digits and whitespace, so the default token_pattern reduces to keeping
+    whitespace-separated words of two or more characters.
+    """
+    tokens = [t for t in tokens if len(t) > 1 and t not in stop_words]
+    min_n, max_n = ngram_range
+    if max_n == 1:
+        return tokens
+    grams = list(tokens) if min_n == 1 else []
+    for n in range(max(min_n, 2), max_n + 1):
+        grams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return grams
+
+def get_token_vectorizer():
+    """
+    Returns a vectorizer sharing vocabulary and IDF weights with
+    vectorizer_model whose analyzer consumes token lists, or None when the
+    fitted vectorizer tokenizes in a way the cached tokens can't reproduce.
+    """
+    global token_vectorizer_model
+
+    if vectorizer_model is None:
+        return None
+    if token_vectorizer_model is None:
+        if (vectorizer_model.analyzer != "word"
+                or vectorizer_model.tokenizer is not None
+                or vectorizer_model.preprocessor is not None
+                or vectorizer_model.token_pattern != DEFAULT_TOKEN_PATTERN):
+            return None
+        token_vectorizer_model = copy.copy(vectorizer_model)
+        token_vectorizer_model.analyzer = partial(
+            _analyze_tokens,
+            ngram_range=vectorizer_model.ngram_range,
+            stop_words=frozenset(vectorizer_model.get_stop_words() or ()),
+        )
+    return token_vectorizer_model
+
+def load_head_models():
+    """
+    Loads the multi-head classifiers (threat category, attack vector,
+    severity) trained by train_and_save_heads(). They score the same
+    TF-IDF features as classifier_model.
+
+    Returns:
+        dict or None: Head name -> fitted classifier, or None if the heads
+                      have not been trained yet or were trained on another
+                      vectorizer's features.
+    """
+    global head_models
+
+    load_model_artifacts()
+    if vectorizer_model is None:
+        return None
+    if head_models is None:
+        if not os.path.exists(HEADS_PATH):
+            print(f"WARNING: {HEADS_PATH} not found. Run train_model.train_and_save_heads() first.")
+            return None
+        head_models = joblib.load(HEADS_PATH)
+    return head_models if _fits_vectorizer(head_models.values(), HEADS_PATH) else None
+
+def train_and_save_heads(train_texts, head_labels):
+    """
+    Fits one classifier per head on a single TF-IDF matrix built with the
+    already fitted vectorizer_model, so heads stay aligned with the
+    binary classifier's features.
 
     Args:
-        text (str): The clean text to classify.
+        train_texts (list of str): Clean training texts.
+        head_labels (dict): Head name -> list of labels, one per text.
+    """
+    global head_models
+
+    load_model_artifacts()
+    X_train = vectorizer_model.transform(train_texts)
+    heads = {}
+    for name, labels in head_labels.items():
+        print(f"Training {name} head...")
+        clf = RandomForestClassifier(n_estimators=HEAD_ESTIMATORS, random_state=42)
+        clf.fit(X_train, labels)
+        clf.feature_fingerprint_ = vectorizer_fingerprint
+        heads[name] = clf
+
+    joblib.dump(heads, HEADS_PATH)
+    head_models = heads
+    print(f"Head models saved: {HEADS_PATH} ({', '.join(heads)})")
+
+def _transfer_set(texts, copies, rate, seed, vocabulary=(), inserts=0):
+    # Transfer set for distillation: each text plus copies with words
+    # randomly dropped and up to ``inserts`` random vocabulary terms added,
+    # so the student sees the forest away from the handful of exact
+    # training texts, including on terms those texts never use
+    rng = random.Random(seed)
+    vocabulary = list(vocabulary)
+    transfer = list(texts)
+    for _ in range(copies):
+        for text in texts:
+            words = [w for w in text.split() if rng.random() >= rate]
+            if vocabulary and inserts:
+                words += rng.sample(vocabulary, rng.randint(0, min(inserts, len(vocabulary))))
+            transfer.append(" ".join(words or text.split()[:1]))
+    return transfer
+
+def distill_forest(vectorizer, forest, texts, copies=20, dropout=0.3, inserts=4, C=10.0, seed=42,
+                   quantile=TRIAGE_QUANTILE):
+    """
+    Fits a sparse (L1) logistic regression to a forest's soft labels.
+
+    Every transfer text appears once as a threat weighted by the forest's
+    P(threat) and once as benign weighted by 1 - P(threat), which is
+    logistic regression against soft targets.
+
+    The student's triage margin (``triage_margin_``) is the ``quantile`` of
+    |P_student - P_forest| over a held-out transfer set drawn with another
+    seed (the fitted one would understate it): triage_proba() only keeps the
+    student's score when it is further than that from every cut point.
+
+    Args:
+        vectorizer: Fitted TF-IDF vectorizer the forest was trained on.
+        forest: Fitted binary classifier with predict_proba.
+        texts (list of str): Texts to build the transfer set from.
 
     Returns:
-        dict: Contains 'is_threat' (boolean), 'confidence' (float),
-              and 'threat_class' (str).
+        LogisticRegression: The student; score it with distilled_proba().
+    """
+    texts = list(texts)
+    vocabulary = vectorizer.get_feature_names_out()
+    X = vectorizer.transform(_transfer_set(texts, copies, dropout, seed, vocabulary, inserts))
+    soft = forest.predict_proba(X)[:, 1]
+    n = X.shape[0]
+    student = LogisticRegression(penalty="l1", solver="liblinear", C=C)
+    student.fit(vstack([X, X]), np.r_[np.ones(n), np.zeros(n)], sample_weight=np.r_[soft, 1 - soft])
+
+    # Perturbed copies only: the original texts were all fitted on
+    held_out = _transfer_set(texts, copies, dropout, seed + 1, vocabulary, inserts)[len(texts):]
+    X_held_out = vectorizer.transform(held_out)
+    gap = np.abs(distilled_proba(student, X_held_out) - forest.predict_proba(X_held_out)[:, 1])
+    student.triage_margin_ = float(np.quantile(gap, quantile))
+    student.feature_fingerprint_ = feature_fingerprint(vectorizer)
+    return student
+
+def distilled_proba(student, X):
+    """P(threat) from the student: one sparse dot product per batch."""
+    return expit(X @ student.coef_.ravel() + student.intercept_[0])
+
+def triage_proba(student, forest, X, margin=None):
+    """
+    Two-tier P(threat): the student scores every row, the forest re-scores
+    only rows within margin of a THREAT_CLASS_CUTS cut point. The margin
+    defaults to the one measured when the student was distilled.
+
+    Returns:
+        tuple: (P(threat) array, boolean array of escalated rows)
+    """
+    if margin is None:
+        margin = getattr(student, "triage_margin_", TRIAGE_MARGIN)
+    threat_p = distilled_proba(student, X)
+    escalated = np.zeros(X.shape[0], dtype=bool)
+    for cut in THREAT_CLASS_CUTS:
+        escalated |= np.abs(threat_p - cut) < margin
+    if escalated.any():
+        threat_p[escalated] = forest.predict_proba(X[escalated])[:, 1]
+    return threat_p, escalated
+
+def load_distilled_model():
+    """
+    Loads the linear student trained by train_and_save_distilled().
+
+    Returns:
+        LogisticRegression or None: None if it has not been trained yet or
+            was distilled on another vectorizer's features; two-tier
+            scoring then falls back to the forest.
+    """
+    global distilled_model
+
+    load_model_artifacts()
+    if vectorizer_model is None:
+        return None
+    if distilled_model is None:
+        if not os.path.exists(DISTILLED_PATH):
+            print(f"WARNING: {DISTILLED_PATH} not found. Run train_model.train_and_save_distilled() first.")
+            return None
+        distilled_model = joblib.load(DISTILLED_PATH)
+    return distilled_model if _fits_vectorizer([distilled_model], DISTILLED_PATH) else None
+
+def train_and_save_distilled(train_texts):
+    """
+    Distills classifier_model into a sparse linear model over the same
+    vectorizer_model features and saves it for two-tier scoring.
+
+    Args:
+        train_texts (list of str): Texts to build the transfer set from.
+    """
+    global distilled_model
+
+    load_model_artifacts()
+    print("Distilling classifier into a sparse linear model...")
+    student = distill_forest(vectorizer_model, classifier_model, train_texts)
+    joblib.dump(student, DISTILLED_PATH)
+    distilled_model = student
+    print(f"Distilled model saved: {DISTILLED_PATH} "
+          f"({np.count_nonzero(student.coef_)}/{student.coef_.size} non-zero weights, "
+          f"triage margin {student.triage_margin_:.3f})")
+
+def vectorize_batch(texts, token_lists=None):
+    """
+    Builds the TF-IDF matrix for a batch once, reusing cached tokens
+    when every item has them.
+    """
+    token_vectorizer = get_token_vectorizer() if token_lists is not None else None
+    if token_vectorizer is not None:
+        return token_vectorizer.transform(token_lists)
+    return vectorizer_model.transform(texts)
+
+def predict_batch(texts, token_lists=None, heads=None, two_tier=False):
+    """
+    Scores a batch of clean texts with the binary classifier and, if
+    given, every multi-head classifier, all on one shared feature matrix.
+
+    Args:
+        texts (list of str): Clean texts to classify.
+        token_lists (list of list of str, optional): Cached token streams,
+            one per text.
+        heads (dict, optional): Head models from load_head_models().
+        two_tier (bool): Score with the distilled linear model and send
+            only items near a threat_class cut point to the forest.
+            Falls back to the forest alone if no distilled model exists.
+
+    Returns:
+        list of dict: One prediction per text with 'is_threat', 'confidence'
+                      and 'threat_class', plus '<head>' and
+                      '<head>_confidence' for each head, and 'escalated'
+                      in two-tier mode.
     """
     # Ensure models are loaded before prediction
     if vectorizer_model is None or classifier_model is None:
@@ -91,46 +377,101 @@ def predict_threat(text):
     if vectorizer_model is None or classifier_model is None:
         # If models still can't be loaded, return a default/error state
         print("ERROR: Models not available for prediction. Returning default.")
-        return {
+        return [{
             "is_threat": False,
             "confidence": 0.0,
             "threat_class": "unknown"
-        }
+        } for _ in texts]
+
+    if not texts:
+        return []
 
-    X = vectorizer_model.transform([text])
+    X = vectorize_batch(texts, token_lists)
     # clf.predict_proba returns probabilities for all classes.
-    # proba[0] gives probabilities for the first sample.
-    # For binary classification (0 or 1), proba[0][1] is prob of class 1 (threat).
-    proba = classifier_model.predict_proba(X)[0]
-    
-    # Get the predicted class (0 or 1)
-    predicted_class = classifier_model.predict(X)[0]
+    # For binary classification (0 or 1), column 1 is prob of class 1 (threat).
+    # The predicted class is the argmax, which is what clf.predict() returns.
+    student = load_distilled_model() if two_tier else None
+    if student is not None:
+        threat_p, escalated = triage_proba(student, classifier_model, X)
+        proba = np.column_stack([1 - threat_p, threat_p])
+    else:
+        proba = classifier_model.predict_proba(X)
+    predicted = proba.argmax(axis=1)
 
-    return {
-        "is_threat": bool(predicted_class), # Convert 0/1 to boolean
-        "confidence": float(proba[predicted_class]), # Confidence in the predicted class
-        "threat_class": "critical" if proba[1] > 0.7 else "suspicious" if proba[1] > 0.5 else "benign"
-    }
+    predictions = [{
+        "is_threat": bool(classifier_model.classes_[c]), # Convert 0/1 to boolean
+        "confidence": float(p[c]), # Confidence in the predicted class
+        "threat_class": "critical" if p[1] > 0.7 else "suspicious" if p[1] > 0.5 else "benign"
+    } for p, c in zip(proba, predicted)]
+    if student is not None:
+        for prediction, e in zip(predictions, escalated):
+            prediction["escalated"] = bool(e)
 
-def analyze_data(processed_data):
+    for name, head in (heads or {}).items():
+        head_proba = head.predict_proba(X)
+        best = head_proba.argmax(axis=1)
+        labels = head.classes_[best]
+        for prediction, label, p, c in zip(predictions, labels, head_proba, best):
+            prediction[name] = label.item() if hasattr(label, "item") else label
+            prediction[f"{name}_confidence"] = float(p[c])
+    return predictions
+
+def predict_threat(text, tokens=None, two_tier=False):
+    """
+    Predicts if a given text is a threat using the loaded models.
+    Assumes load_model_artifacts() has been called.
+
+    Args:
+        text (str): The clean text to classify.
+        tokens (list of str, optional): Token stream cached by
+            data_processor.normalize_text. When given, the vectorizer reuses
+            it instead of re-tokenizing text.
+        two_tier (bool): Triage with the distilled linear model first and
+            only escalate near-boundary texts to the forest.
+
+    Returns:
+        dict: Contains 'is_threat' (boolean), 'confidence' (float),
+              and 'threat_class' (str).
+    """
+    return predict_batch([text], None if tokens is None else [tokens], two_tier=two_tier)[0]
+
+def analyze_data(processed_data, multihead=False, ioc_index=None, two_tier=False):
     """
     Applies the threat prediction to a list of processed data items.
 
+    The whole batch is vectorized once; in multi-head mode the category,
+    attack vector and severity heads score that same matrix.
+
     Args:
         processed_data (list of dict): Data processed by data_processor.py.
+        multihead (bool): Also predict 'threat_category', 'attack_vector'
+                          and 'severity' (each with a '_confidence').
+        ioc_index (threat_intel.IOCIndex, optional): Known indicators; adds
+                          'ioc_matches' with the IOCs in each item's text
+                          found in the index.
+        two_tier (bool): Linear triage with forest escalation (see
+                          predict_batch).
 
     Returns:
         list of dict: Each item enriched with 'is_threat', 'confidence', and 'threat_class'.
     """
     # Ensure models are loaded when analyze_data is called from main.py
     load_model_artifacts() 
+    heads = load_head_models() if multihead else None
+
+    # Use .get for safety; fall back to strings unless every item has tokens
+    texts = [item.get("clean_text", "") for item in processed_data]
+    token_lists = [item.get("tokens") for item in processed_data]
+    if any(tokens is None for tokens in token_lists):
+        token_lists = None
 
-    results = []
-    for item in processed_data:
-        # Pass the clean text for prediction
-        prediction = predict_threat(item.get("clean_text", "")) # Use .get for safety
-        results.append({**item, **prediction})
-    return results
+    predictions = predict_batch(texts, token_lists, heads, two_tier)
+    if ioc_index is not None:
+        # IOCs are matched on the raw text: clean_text has lost the dots
+        matches = ioc_index.match_batch([item.get("text", "") for item in processed_data])
+        for prediction, ioc_matches in zip(predictions, matches):
+            prediction["ioc_matches"] = ioc_matches
+    return [{**item, **prediction} for item, prediction in zip(processed_data, predictions)]
 
 if __name__ == "__main__":
     # --- This block is for training the model manually ---
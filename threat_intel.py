@@ -1,16 +1,40 @@
 # threat_intel.py
+import hashlib
+import json
+import re
 import requests
 import os
+import numpy as np
 from dotenv import load_dotenv
+from bloom_filter import BloomFilter, save_array
+from data_loader import load_dataset_iocs
+from utils import rate_limited, retry
 load_dotenv()
 
 OTX_API_KEY = os.getenv("OTX_API_KEY")
+# Point at a local mock server for testing
+OTX_BASE_URL = os.getenv("OTX_BASE_URL", "https://otx.alienvault.com")
 HEADERS = {
     "X-OTX-API-KEY": OTX_API_KEY
 }
+OTX_PAGE_SIZE = 50
+OTX_STATE_PATH = "otx_sync_state.json"
+IOC_INDEX_PATH = "ioc_index.npy"
+IOC_BLOOM_FP_RATE = 0.01
+
+# IPv4, CVE ids, URLs, MD5/SHA1/SHA256 hashes and domain-like names
+# (which also catches file names such as "infected.exe")
+IOC_PATTERN = re.compile(
+    r'https?://[^\s"\'<>]+'
+    r'|\b(?:\d{1,3}\.){3}\d{1,3}\b'
+    r'|\bCVE-\d{4}-\d{4,7}\b'
+    r'|\b(?:[a-f0-9]{64}|[a-f0-9]{40}|[a-f0-9]{32})\b'
+    r'|\b(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}\b',
+    re.IGNORECASE
+)
 
 def get_recent_public_pulses(limit=5):
-    url = f"https://otx.alienvault.com/api/v1/pulses/explore?limit={limit}"
+    url = f"{OTX_BASE_URL}/api/v1/pulses/explore?limit={limit}"
     headers = {"X-OTX-API-KEY": os.getenv("OTX_API_KEY")}
     try:
         response = requests.get(url, headers=headers, timeout=10)
@@ -21,13 +45,238 @@ def get_recent_public_pulses(limit=5):
         return []
 
 
-def enrich_threat_data(threat):
-    # Extract IOCs from threat text
+class IOCIndex:
+    """
+    Compact set of known indicators for O(1) membership checks.
+
+    Indicators are normalized (stripped, lowercased) and stored as 64-bit
+    BLAKE2b hashes rather than strings. While syncing, the hashes live in a
+    Python set. save() writes them as a sorted uint64 array plus a blocked
+    Bloom filter; load() memory-maps both, so lookups are pre-screened by the
+    filter and only hits are confirmed by binary search in the sorted array.
+    match_batch() does both for all IOCs of a batch of texts in a few NumPy
+    calls; `in` is for the odd single indicator.
+    """
+
+    def __init__(self, hashes=(), bloom=None, sorted_hashes=None):
+        self._hashes = set(hashes) if sorted_hashes is None else None
+        self._sorted = sorted_hashes
+        self.bloom = bloom
+
+    @staticmethod
+    def key(indicator):
+        digest = hashlib.blake2b(indicator.strip().lower().encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    @staticmethod
+    def keys(indicators):
+        """key() of each indicator, as a uint64 array."""
+        digests = b"".join(hashlib.blake2b(i.strip().lower().encode(), digest_size=8).digest()
+                           for i in indicators)
+        return np.frombuffer(digests, dtype="<u8").astype(np.uint64)
+
+    def _thaw(self):
+        # Adding to a loaded (memory-mapped) index switches back to a set
+        if self._hashes is None:
+            self._hashes = set(self._sorted.tolist())
+            self._sorted = None
+            self.bloom = None
+
+    def add(self, indicator):
+        self._thaw()
+        self._hashes.add(self.key(indicator))
+
+    def update(self, indicators):
+        self._thaw()
+        self._hashes.update(self.key(i) for i in indicators)
+
+    def screen(self, indicator, key=None):
+        """Bloom pre-screen: False means definitely unknown, True means maybe."""
+        if self.bloom is None:
+            return True
+        return self.bloom.might_contain_key(self.key(indicator) if key is None else key)
+
+    def confirm(self, indicator, key=None):
+        """Exact membership check."""
+        key = self.key(indicator) if key is None else key
+        if self._hashes is not None:
+            return key in self._hashes
+        i = int(np.searchsorted(self._sorted, np.uint64(key)))
+        return i < len(self._sorted) and int(self._sorted[i]) == key
+
+    def __contains__(self, indicator):
+        key = self.key(indicator)
+        return self.screen(indicator, key) and self.confirm(indicator, key)
+
+    def contains_keys(self, keys):
+        """
+        Vectorized membership for an array of keys: one Bloom screen over
+        all of them, then one binary search over the filter's hits only.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        if self._hashes is not None:
+            return np.array([k in self._hashes for k in keys.tolist()], dtype=bool)
+        found = np.zeros(len(keys), dtype=bool)
+        if not len(keys) or not len(self._sorted):
+            return found
+        if self.bloom is not None:
+            candidates = np.flatnonzero(self.bloom.might_contain_keys(keys))
+        else:
+            candidates = np.arange(len(keys))
+        hits = keys[candidates]
+        pos = np.minimum(np.searchsorted(self._sorted, hits), len(self._sorted) - 1)
+        found[candidates] = self._sorted[pos] == hits
+        return found
+
+    def __len__(self):
+        return len(self._hashes) if self._hashes is not None else len(self._sorted)
+
+    def match_batch(self, texts):
+        """For each text, the IOCs found in it that are in the index."""
+        iocs = [extract_iocs(text) for text in texts]
+        found = iter(self.contains_keys(self.keys(ioc for item in iocs for ioc in item)).tolist())
+        return [[ioc for ioc in item if next(found)] for item in iocs]
+
+    def match_text(self, text):
+        """Returns the IOCs found in text that are in the index."""
+        return self.match_batch([text])[0]
+
+    @staticmethod
+    def bloom_path(path):
+        return os.path.splitext(path)[0] + ".bloom.npy"
+
+    def save(self, path=IOC_INDEX_PATH, fp_rate=IOC_BLOOM_FP_RATE):
+        """Writes the sorted hashes to path and their Bloom filter next to it."""
+        if self._hashes is None:
+            hashes = np.array(self._sorted)
+        else:
+            hashes = np.sort(np.fromiter(self._hashes, dtype=np.uint64, count=len(self._hashes)))
+        save_array(path, hashes)
+        bloom = BloomFilter.for_capacity(len(hashes), fp_rate)
+        bloom.add_keys(hashes)
+        bloom.save(self.bloom_path(path))
+
+    @classmethod
+    def load(cls, path=IOC_INDEX_PATH, mmap=True):
+        """Loads a saved index (memory-mapped), or returns an empty one if none exists."""
+        if not os.path.exists(path):
+            return cls()
+        hashes = np.load(path, mmap_mode="r" if mmap else None)
+        return cls(bloom=BloomFilter.load(cls.bloom_path(path), mmap=mmap), sorted_hashes=hashes)
+
+
+@retry(max_retries=3)
+@rate_limited(60)
+def _get_otx_json(url, params=None):
+    headers = {"X-OTX-API-KEY": os.getenv("OTX_API_KEY")}
+    response = requests.get(url, headers=headers, params=params, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+def iter_subscribed_pulses(modified_since=None, page_size=OTX_PAGE_SIZE):
+    """
+    Yields every subscribed pulse modified after modified_since, following
+    the API's 'next' links one page at a time.
+    """
+    params = {"limit": page_size}
+    if modified_since:
+        params["modified_since"] = modified_since
+    url = f"{OTX_BASE_URL}/api/v1/pulses/subscribed"
+    while url:
+        page = _get_otx_json(url, params)
+        yield from page.get("results", [])
+        url = page.get("next")
+        params = None  # 'next' already carries the query string
+
+def load_sync_state(path=OTX_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def seed_dataset_iocs(index=None, dataset_path='Cybersecurity_Dataset.csv', index_path=IOC_INDEX_PATH):
+    """Adds the dataset's 'IOCs (Indicators of Compromise)' column to the index and saves it."""
+    index = index if index is not None else IOCIndex.load(index_path)
+    index.update(load_dataset_iocs(dataset_path))
+    index.save(index_path)
+    return index
+
+def sync_otx(index=None, state_path=OTX_STATE_PATH, index_path=IOC_INDEX_PATH,
+             page_size=OTX_PAGE_SIZE, dataset_path='Cybersecurity_Dataset.csv'):
+    """
+    Incrementally syncs subscribed OTX pulses into an IOCIndex.
+
+    Only pulses modified since the last run's watermark are fetched; their
+    indicators are streamed straight into the index, which is then saved
+    together with the new watermark. When no index exists at index_path
+    yet, the fresh one is seeded with the dataset's IOCs first.
+
+    Returns:
+        IOCIndex: The updated index.
+    """
+    if index is None:
+        if os.path.exists(index_path):
+            index = IOCIndex.load(index_path)
+        else:
+            index = IOCIndex()
+            index.update(load_dataset_iocs(dataset_path))
+    state = load_sync_state(state_path)
+    watermark = state.get("modified_since")
+    pulses = indicators = 0
+
+    try:
+        for pulse in iter_subscribed_pulses(watermark, page_size):
+            pulses += 1
+            for indicator in pulse.get("indicators", []):
+                index.add(indicator["indicator"])
+                indicators += 1
+            modified = pulse.get("modified")
+            # OTX timestamps are ISO 8601, so string order is time order
+            if modified and (watermark is None or modified > watermark):
+                watermark = modified
+    except requests.RequestException as e:
+        # Keep what was synced so far; the old watermark makes the next run redo the rest
+        print(f"[!] OTX sync interrupted: {e}")
+        watermark = state.get("modified_since")
+
+    index.save(index_path)
+    # Written after the index and replaced atomically, so a crash leaves the
+    # old watermark in place and the next run redoes this one's pulses
+    tmp = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"modified_since": watermark, "indicators": len(index)}, f)
+    os.replace(tmp, state_path)
+    print(f"[+] OTX sync: {pulses} pulses, {indicators} indicators, {len(index)} in index")
+    return index
+
+
+# Loaded from IOC_INDEX_PATH on first use by get_ioc_index()
+ioc_index = None
+
+def get_ioc_index():
+    global ioc_index
+    if ioc_index is None:
+        ioc_index = IOCIndex.load()
+    return ioc_index
+
+def enrich_threat_data(threat, index=None):
+    """
+    Adds the IOCs found in a threat's text ('iocs') and those known to the
+    intel index ('ioc_matches').
+    """
     iocs = extract_iocs(threat['text'])
-    
-   
+    index = index if index is not None else get_ioc_index()
+    # The Bloom filter rejects almost every unknown IOC without touching
+    # the exact hash array; only its hits are confirmed
+    found = index.contains_keys(IOCIndex.keys(iocs))
+    matches = [ioc for ioc, known in zip(iocs, found) if known]
+    return {
+        **threat,
+        "iocs": iocs,
+        "ioc_matches": matches
+    }
+
 def extract_iocs(text):
-    # Simplified IOC extraction (in practice, use regex/ML models)
-    iocs = []
-    # Add domain/IP/CVE extraction logic here
-    return iocs
\ No newline at end of file
+    # Regex IOC extraction: IPs, CVEs, URLs, hashes and domains, deduplicated in order
+    return list(dict.fromkeys(m.group(0).rstrip('.,;)') for m in IOC_PATTERN.finditer(text)))
+
@@ -0,0 +1,433 @@
+# threat_stats.py
+# Streaming threat statistics and volume spike detection.
+#
+# Analyzed items are counted as they come out of the pipeline, never
+# re-aggregated from stored rows:
+#   - per source, threat category and actor, a RollingCounter keeps a ring
+#     of per-minute buckets over the last hour plus an EWMA mean/variance
+#     of closed buckets, so an update is O(1) and the current bucket can be
+#     compared against that key's own baseline (spike detection);
+#   - actors and keywords also go into count-min sketches with a small
+#     heavy-hitter table, giving top-k lists in fixed memory however many
+#     distinct names appear. Sketch counts are halved every window so the
+#     lists follow recent activity.
+# update() returns spike alerts; save() writes the counter state and a
+# small precomputed snapshot that dashboards read instead of raw rows.
+import hashlib
+import json
+import math
+import os
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import numpy as np
+
+STATS_STATE_PATH = "threat_stats_state.json"
+STATS_SNAPSHOT_PATH = "threat_stats.json"
+BUCKET_SECONDS = 60
+WINDOW_BUCKETS = 60  # one hour of one-minute buckets
+HALF_LIFE_BUCKETS = 30  # EWMA baseline half-life
+SPIKE_Z = 3.0  # alert when a bucket exceeds baseline mean + SPIKE_Z std
+SPIKE_MIN_COUNT = 10  # ... and holds at least this many items
+WARMUP_BUCKETS = 10  # closed buckets needed before a key can alert
+MAX_KEYS = 10000  # rolling counters kept per dimension (least recent dropped)
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+TOP_K = 10
+RECENT_SPIKES = 50
+
+WINDOW_DIMENSIONS = ("source", "category", "actor")
+SKETCH_DIMENSIONS = ("actor", "keyword")
+
+
+def item_time(item, now):
+    """The item's own timestamp (ISO 8601 or RFC 2822) as epoch seconds, else now."""
+    value = item.get("timestamp")
+    if value:
+        for parse in (datetime.fromisoformat, parsedate_to_datetime):
+            try:
+                parsed = parse(value) if isinstance(value, str) else value
+                if parsed.tzinfo is None:
+                    parsed = parsed.replace(tzinfo=timezone.utc)
+                # Never ahead of the clock: a skewed feed must not roll every window forward
+                return min(parsed.timestamp(), now)
+            except (TypeError, ValueError, AttributeError):
+                continue
+    return now
+
+
+def item_keys(item):
+    """(dimension, key) pairs an analyzed item is counted under."""
+    entities = item.get("entities") or {}
+    keys = [("source", item.get("source") or "unknown"),
+            ("category", item.get("threat_category") or item.get("threat_class") or "unknown")]
+    # spaCy ORG entities are where threat groups and vendors show up
+    keys.extend(("actor", name) for name in dict.fromkeys(entities.get("orgs", [])))
+    keys.extend(("keyword", word) for word in dict.fromkeys(entities.get("threats", [])))
+    return keys
+
+
+class RollingCounter:
+    """
+    Sliding-window count over ``buckets`` fixed buckets with an EWMA
+    baseline of closed bucket counts.
+
+    Buckets are absolute indices (epoch seconds // bucket width). Moving
+    forward closes buckets into the baseline and clears the slots that fall
+    out of the window, so the cost is bounded by the window however long
+    the gap.
+    """
+
+    def __init__(self, buckets=WINDOW_BUCKETS, alpha=1 - 0.5 ** (1 / HALF_LIFE_BUCKETS)):
+        self.slots = [0] * buckets
+        self.alpha = alpha
+        self.bucket = None  # current (newest) bucket index
+        self.total = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.closed = 0
+        self.alerted = None  # bucket that already fired a spike
+
+    def _close(self, count):
+        diff = count - self.mean
+        incr = self.alpha * diff
+        self.mean += incr
+        self.var = (1 - self.alpha) * (self.var + diff * incr)
+        self.closed += 1
+
+    def advance(self, bucket):
+        if self.bucket is None:
+            self.bucket = bucket
+            return
+        n = len(self.slots)
+        if bucket - self.bucket > n:
+            # Long silence: close the current bucket, then fold in the empty
+            # ones (exactly for one window, the rest only decay the baseline)
+            self._close(self.slots[self.bucket % n])
+            for _ in range(n):
+                self._close(0)
+            rest = bucket - self.bucket - 1 - n
+            self.mean *= (1 - self.alpha) ** rest
+            self.var *= (1 - self.alpha) ** rest
+            self.closed += rest
+            self.slots = [0] * n
+            self.total = 0
+            self.bucket = bucket
+            return
+        while self.bucket < bucket:
+            self._close(self.slots[self.bucket % n])
+            self.bucket += 1
+            slot = self.bucket % n
+            self.total -= self.slots[slot]
+            self.slots[slot] = 0
+
+    def add(self, bucket, count=1):
+        """
+        Counts items in a bucket. Returns the current bucket's count if
+        that is the bucket added to, None for late items or items too old
+        for the window.
+        """
+        self.advance(bucket)
+        n = len(self.slots)
+        if bucket <= self.bucket - n:
+            return None
+        self.slots[bucket % n] += count
+        self.total += count
+        return self.slots[bucket % n] if bucket == self.bucket else None
+
+    def threshold(self, z=SPIKE_Z):
+        return self.mean + z * math.sqrt(max(self.var, 0.0))
+
+    def series(self):
+        """Counts of the window's buckets, oldest first."""
+        if self.bucket is None:
+            return []
+        n = len(self.slots)
+        return [self.slots[b % n] for b in range(self.bucket - n + 1, self.bucket + 1)]
+
+    def to_dict(self):
+        return {"slots": self.slots, "bucket": self.bucket, "total": self.total, "mean": self.mean,
+                "var": self.var, "closed": self.closed, "alerted": self.alerted}
+
+    @classmethod
+    def from_dict(cls, state, alpha):
+        counter = cls(len(state["slots"]), alpha)
+        counter.slots = list(state["slots"])
+        for name in ("bucket", "total", "mean", "var", "closed", "alerted"):
+            setattr(counter, name, state[name])
+        return counter
+
+
+class CountMinSketch:
+    """
+    Count-min sketch over string keys: estimates never undercount and
+    overcount by at most ~2N/width with high probability.
+    """
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.int64)
+        self._rows = np.arange(depth)
+
+    def _columns(self, key):
+        # Double hashing: row i uses h1 + i * h2
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key, count=1):
+        """Adds count to key and returns its new estimate."""
+        columns = self._columns(key)
+        self.table[self._rows, columns] += count
+        return int(self.table[self._rows, columns].min())
+
+    def estimate(self, key):
+        return int(self.table[self._rows, self._columns(key)].min())
+
+    def decay(self, halvings=1):
+        # Counts are non-negative int64, so 63 halvings clear any count
+        self.table >>= min(halvings, 63)
+
+
+class HeavyHitters:
+    """
+    Top-k keys by sketch estimate. Keeps a few more candidates than k so
+    keys near the cut-off are not constantly swapped in and out.
+    """
+
+    def __init__(self, k=TOP_K, candidates=None):
+        self.k = k
+        self.capacity = 4 * k
+        self.counts = dict(candidates or {})
+
+    def offer(self, key, estimate):
+        if key in self.counts or len(self.counts) < self.capacity:
+            self.counts[key] = estimate
+            return
+        weakest = min(self.counts, key=self.counts.get)
+        if estimate > self.counts[weakest]:
+            del self.counts[weakest]
+            self.counts[key] = estimate
+
+    def decay(self, halvings=1):
+        self.counts = {key: count >> halvings for key, count in self.counts.items() if count >> halvings}
+
+    def top(self):
+        return sorted(self.counts.items(), key=lambda kv: -kv[1])[:self.k]
+
+
+class ThreatStats:
+    """
+    Rolling per-dimension counters, sketches and spike detection for
+    analyzed items. Feed it with update(); persist it with save().
+    """
+
+    def __init__(self, bucket_seconds=BUCKET_SECONDS, window_buckets=WINDOW_BUCKETS,
+                 half_life_buckets=HALF_LIFE_BUCKETS, z=SPIKE_Z, min_count=SPIKE_MIN_COUNT,
+                 warmup_buckets=WARMUP_BUCKETS, max_keys=MAX_KEYS):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.alpha = 1 - 0.5 ** (1 / half_life_buckets)
+        self.z = z
+        self.min_count = min_count
+        self.warmup_buckets = warmup_buckets
+        self.max_keys = max_keys
+        self.overall = RollingCounter(window_buckets, self.alpha)
+        self.counters = {dimension: OrderedDict() for dimension in WINDOW_DIMENSIONS}
+        self.sketches = {dimension: CountMinSketch() for dimension in SKETCH_DIMENSIONS}
+        self.heavy = {dimension: HeavyHitters() for dimension in SKETCH_DIMENSIONS}
+        self.last_decay = None
+        self.spikes = deque(maxlen=RECENT_SPIKES)
+
+    def _counter(self, dimension, key):
+        counters = self.counters[dimension]
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = RollingCounter(self.window_buckets, self.alpha)
+            if len(counters) > self.max_keys:
+                counters.popitem(last=False)
+        else:
+            counters.move_to_end(key)
+        return counter
+
+    def _check(self, dimension, key, counter, count, bucket):
+        if (count is None or counter.alerted == bucket or counter.closed < self.warmup_buckets
+                or count < max(self.min_count, counter.threshold(self.z))):
+            return None
+        counter.alerted = bucket
+        spike = {
+            "dimension": dimension,
+            "key": key,
+            "count": count,
+            "baseline": round(counter.mean, 2),
+            "threshold": round(counter.threshold(self.z), 2),
+            "bucket_start": datetime.fromtimestamp(bucket * self.bucket_seconds, timezone.utc).isoformat(),
+        }
+        self.spikes.append(spike)
+        return spike
+
+    def update(self, items, now=None):
+        """
+        Counts analyzed items (oldest first by their own timestamps).
+
+        Returns:
+            list of dict: Spikes fired by this update, at most one per key
+                          and bucket, each with 'dimension', 'key', 'count',
+                          'baseline', 'threshold' and 'bucket_start'.
+        """
+        now = datetime.now(timezone.utc).timestamp() if now is None else now
+        window = self.bucket_seconds * self.window_buckets
+        if self.last_decay is None:
+            self.last_decay = now
+        elif now - self.last_decay >= window:
+            # One halving per window elapsed, however long since the last update
+            halvings = int((now - self.last_decay) // window)
+            for dimension in SKETCH_DIMENSIONS:
+                self.sketches[dimension].decay(halvings)
+                self.heavy[dimension].decay(halvings)
+            self.last_decay += halvings * window
+
+        spikes = []
+        for t, item in sorted(((item_time(item, now), item) for item in items), key=lambda pair: pair[0]):
+            bucket = int(t // self.bucket_seconds)
+            spike = self._check("all", "all", self.overall, self.overall.add(bucket), bucket)
+            if spike:
+                spikes.append(spike)
+            for dimension, key in item_keys(item):
+                if dimension in self.sketches:
+                    self.heavy[dimension].offer(key, self.sketches[dimension].add(key))
+                if dimension in self.counters:
+                    counter = self._counter(dimension, key)
+                    spike = self._check(dimension, key, counter, counter.add(bucket), bucket)
+                    if spike:
+                        spikes.append(spike)
+        return spikes
+
+    def window_totals(self, dimension, limit=20):
+        """Items per key in the current window, largest first."""
+        totals = [(key, c.total) for key, c in self.counters[dimension].items() if c.total]
+        return sorted(totals, key=lambda kv: -kv[1])[:limit]
+
+    def snapshot(self):
+        """Precomputed view for dashboards."""
+        series_end = self.overall.bucket
+        series = []
+        if series_end is not None:
+            first = series_end - self.window_buckets + 1
+            series = [[datetime.fromtimestamp((first + i) * self.bucket_seconds, timezone.utc).isoformat(), count]
+                      for i, count in enumerate(self.overall.series())]
+        return {
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "bucket_seconds": self.bucket_seconds,
+            "window_seconds": self.bucket_seconds * self.window_buckets,
+            "window_total": self.overall.total,
+            "series": series,
+            "windows": {dimension: self.window_totals(dimension) for dimension in WINDOW_DIMENSIONS},
+            "top": {dimension: self.heavy[dimension].top() for dimension in SKETCH_DIMENSIONS},
+            "spikes": list(self.spikes),
+        }
+
+    def save(self, state_path=STATS_STATE_PATH, snapshot_path=STATS_SNAPSHOT_PATH):
+        state = {
+            "config": {"bucket_seconds": self.bucket_seconds, "window_buckets": self.window_buckets,
+                       "alpha": self.alpha},
+            "overall": self.overall.to_dict(),
+            "counters": {dimension: {key: c.to_dict() for key, c in counters.items()}
+                         for dimension, counters in self.counters.items()},
+            "sketches": {dimension: s.table.tolist() for dimension, s in self.sketches.items()},
+            "heavy": {dimension: h.counts for dimension, h in self.heavy.items()},
+            "last_decay": self.last_decay,
+            "spikes": list(self.spikes),
+        }
+        for path, document in ((state_path, state), (snapshot_path, self.snapshot())):
+            # Written via rename so a dashboard never reads a half-written file
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(document, f)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, state_path=STATS_STATE_PATH, **kwargs):
+        """Restores saved state, or returns fresh stats if none exists."""
+        stats = cls(**kwargs)
+        if not os.path.exists(state_path):
+            return stats
+        with open(state_path) as f:
+            state = json.load(f)
+        config = state["config"]
+        if (config["bucket_seconds"], config["window_buckets"]) != (stats.bucket_seconds, stats.window_buckets):
+            print(f"[!] {state_path} uses a different window layout; starting fresh")
+            return stats
+        stats.overall = RollingCounter.from_dict(state["overall"], stats.alpha)
+        for dimension, counters in state["counters"].items():
+            stats.counters[dimension] = OrderedDict(
+                (key, RollingCounter.from_dict(c, stats.alpha)) for key, c in counters.items())
+        for dimension, table in state["sketches"].items():
+            stats.sketches[dimension] = CountMinSketch(table=np.array(table, dtype=np.int64))
+        for dimension, counts in state["heavy"].items():
+            stats.heavy[dimension] = HeavyHitters(candidates=counts)
+        stats.last_decay = state["last_decay"]
+        stats.spikes.extend(state["spikes"])
+        return stats
+
+
+def load_snapshot(path=STATS_SNAPSHOT_PATH):
+    """The latest precomputed snapshot, or None before the first save."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# Loaded from STATS_STATE_PATH on first use by get_threat_stats()
+threat_stats = None
+
+def get_threat_stats():
+    global threat_stats
+    if threat_stats is None:
+        threat_stats = ThreatStats.load()
+    return threat_stats
+
+
+if __name__ == "__main__":
+    # Two hours of steady traffic from three sources, then one source bursts.
+    import random
+
+    rng = random.Random(7)
+    stats = ThreatStats()
+    start = 1_750_000_000
+    actors = [f"group{i}" for i in range(200)]
+    spikes = []
+    for minute in range(150):
+        now = start + minute * 60 + 59
+        items = [{
+            "source": rng.choice(["rss", "forum", "darkweb"]),
+            "threat_class": rng.choice(["critical", "suspicious", "benign"]),
+            "timestamp": datetime.fromtimestamp(start + minute * 60 + rng.random() * 59, timezone.utc).isoformat(),
+            "entities": {"orgs": [rng.choice(actors[:5] if rng.random() < 0.5 else actors)],
+                         "threats": [rng.choice(["ransomware", "phishing", "exploit"])]},
+        } for _ in range(rng.randint(8, 12))]
+        if minute >= 140:
+            items += [{"source": "darkweb", "threat_class": "critical",
+                       "timestamp": datetime.fromtimestamp(start + minute * 60 + 30, timezone.utc).isoformat(),
+                       "entities": {"orgs": ["group42"], "threats": ["ransomware"]}}] * 40
+        spikes += stats.update(items, now=now)
+
+    for spike in spikes:
+        print(f"spike: {spike['dimension']}={spike['key']} {spike['count']} items "
+              f"(threshold {spike['threshold']}) at {spike['bucket_start']}")
+    snapshot = stats.snapshot()
+    print("window total:", snapshot["window_total"])
+    print("sources:", snapshot["windows"]["source"])
+    print("top actors:", snapshot["top"]["actor"][:6])
+
+    import tempfile
+    workdir = tempfile.mkdtemp()
+    state_path = os.path.join(workdir, "state.json")
+    stats.save(state_path, os.path.join(workdir, "snapshot.json"))
+    restored = ThreatStats.load(state_path)
+    assert restored.snapshot()["windows"] == snapshot["windows"]
+    print("state restored:", os.path.getsize(state_path), "bytes")
@@ -12,7 +12,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
 from data_loader import load_threat_dataset  # Use the new loader
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-from data_loader import load_threat_dataset
+from data_loader import load_threat_dataset, load_threat_heads_dataset, HEAD_COLUMNS
 
 def train_and_save_model():
     print("\n--- Starting Model Training ---")
@@ -63,5 +63,45 @@ def train_and_save_model():
 
     return model
 
+def train_and_save_heads():
+    """
+    Trains the threat category / attack vector / severity heads used by
+    threat_detector.analyze_data(multihead=True). The heads are fitted on
+    threat_detector's own vectorizer so all heads share one feature matrix.
+    """
+    import threat_detector
+
+    print("\n--- Starting Multi-Head Training ---")
+    df = load_threat_heads_dataset()
+    train_df, test_df = train_test_split(df, test_size=0.2, random_state=42)
+
+    threat_detector.train_and_save_heads(
+        train_df['text'].tolist(),
+        {head: train_df[head].tolist() for head in HEAD_COLUMNS}
+    )
+
+    X_test = threat_detector.vectorizer_model.transform(test_df['text'])
+    for head, model in threat_detector.head_models.items():
+        accuracy = accuracy_score(test_df[head], model.predict(X_test))
+        print(f"{head} head accuracy on test set: {accuracy:.2f}")
+
+def train_and_save_distilled():
+    """
+    Distills threat_detector's forest into the sparse linear model used by
+    two-tier scoring (threat_detector.predict_threat(two_tier=True)).
+    """
+    import threat_detector
+
+    print("\n--- Starting Distillation ---")
+    df = load_threat_dataset()
+    threat_detector.train_and_save_distilled(df['text'].tolist())
+
+    X = threat_detector.vectorizer_model.transform(df['text'])
+    forest = threat_detector.classifier_model.predict_proba(X)[:, 1] > 0.5
+    student = threat_detector.distilled_proba(threat_detector.distilled_model, X) > 0.5
+    print(f"Agreement with the forest on the dataset: {(forest == student).mean():.3f}")
+
 if __name__ == "__main__":
     train_and_save_model()
+    train_and_save_heads()
+    train_and_save_distilled()
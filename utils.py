@@ -1,43 +1,327 @@
 # utils.py
+import asyncio
+import random
+import threading
 import time
+from collections import OrderedDict
 from functools import wraps
+from urllib.parse import urlsplit
 import logging
 from requests.exceptions import RequestException
 
 logging.basicConfig(level=logging.INFO)
 
-def rate_limited(max_per_minute):
-    min_interval = 60.0 / float(max_per_minute)
-    
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to wait longer than the limiter's max_wait."""
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a function whose circuit breaker is open."""
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at ``rate`` tokens per second.
+
+    Callers reserve a token under the lock and then wait outside it, so
+    concurrent callers are queued fairly and never sleep while holding the
+    lock. The same bucket can be shared by threads and asyncio tasks.
+    """
+
+    def __init__(self, rate, capacity=1, max_wait=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.max_wait = max_wait
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Takes tokens and returns how long the caller must wait before using them."""
+        with self._lock:
+            now = self.clock()
+            available = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            wait = max(0.0, (tokens - available) / self.rate)
+            if self.max_wait is not None and wait > self.max_wait:
+                raise RateLimitExceeded(f"rate limit wait of {wait:.2f}s exceeds {self.max_wait}s")
+            # May go negative: that debt is what later callers queue behind
+            self._tokens = available - tokens
+            self._updated = now
+            return wait
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class KeyedRateLimiter:
+    """
+    One TokenBucket per key (e.g. host or API key), created on first use.
+    At most ``max_keys`` buckets are kept; the least recently used is dropped.
+    """
+
+    def __init__(self, max_per_minute, burst=1, max_wait=None, max_keys=10000):
+        self.rate = float(max_per_minute) / 60.0
+        self.burst = burst
+        self.max_wait = max_wait
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, self.max_wait)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+def host_key(url, *args, **kwargs):
+    """Rate limiter key function: the host of the first (URL) argument."""
+    return urlsplit(url).netloc
+
+def rate_limited(max_per_minute, key=None, burst=1, max_wait=None):
+    """
+    Limits calls to ``max_per_minute``, with bursts of up to ``burst``.
+
+    Args:
+        key (callable, optional): Maps the call's arguments to a limiter key
+            (see host_key). Without it the whole function shares one bucket.
+        max_wait (float, optional): Raise RateLimitExceeded instead of
+            waiting longer than this many seconds.
+
+    Works on plain and async functions; async callers await instead of
+    blocking the event loop.
+    """
     def decorate(func):
-        last_time_called = 0.0
-        
+        limiter = KeyedRateLimiter(max_per_minute, burst=burst, max_wait=max_wait)
+
+        def bucket_for(args, kwargs):
+            return limiter.bucket(key(*args, **kwargs) if key else None)
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_rate_limited_function(*args, **kwargs):
+                await bucket_for(args, kwargs).acquire_async()
+                return await func(*args, **kwargs)
+            async_rate_limited_function.limiter = limiter
+            return async_rate_limited_function
+
         @wraps(func)
         def rate_limited_function(*args, **kwargs):
-            nonlocal last_time_called
-            elapsed = time.monotonic() - last_time_called
-            wait = min_interval - elapsed
-            if wait > 0:
-                time.sleep(wait)
-            last_time_called = time.monotonic()
+            bucket_for(args, kwargs).acquire()
             return func(*args, **kwargs)
+        rate_limited_function.limiter = limiter
         return rate_limited_function
     return decorate
 
-def retry(max_retries=3, backoff_factor=0.5, exceptions=(RequestException,)):
+class RetryBudget:
+    """
+    Caps retries to a fraction of overall calls so a struggling service is
+    not hit with a multiple of its normal load. Every call deposits
+    ``ratio`` tokens, every retry withdraws one.
+    """
+
+    def __init__(self, ratio=0.2, initial=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(initial)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """Returns True if a retry may be made."""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls
+    for ``reset_timeout`` seconds, then lets one trial call through
+    (half-open): success closes the circuit, failure opens it again. A
+    trial that never reports back (see abort()) does not block the breaker:
+    another trial is let through once ``reset_timeout`` has passed again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = self.clock()
+            if self.state != self.CLOSED and now - self._opened_at >= self.reset_timeout:
+                # _opened_at doubles as the trial's start while half-open
+                self.state = self.HALF_OPEN
+                self._opened_at = now
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+    def abort(self):
+        """
+        Called when a call ends in an error that is not a counted failure
+        (an unexpected exception or cancellation). A half-open trial goes
+        back to OPEN so a fresh trial follows after reset_timeout.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+def backoff_delay(attempt, backoff_factor=0.5, max_backoff=30.0, jitter=True):
+    """Exponential backoff for the given retry (1-based), with full jitter."""
+    delay = min(max_backoff, backoff_factor * (2 ** (attempt - 1)))
+    return random.uniform(0, delay) if jitter else delay
+
+def retry(max_retries=3, backoff_factor=0.5, exceptions=(RequestException,),
+          max_backoff=30.0, jitter=True, budget=None, breaker=None):
+    """
+    Retries on ``exceptions`` for up to ``max_retries`` attempts.
+
+    Args:
+        budget (RetryBudget, optional): Shared retry budget; once spent,
+            errors are raised without retrying.
+        breaker (CircuitBreaker, optional): Calls fail fast with
+            CircuitOpenError while the breaker is open.
+
+    Works on plain and async functions; async callers await the backoff.
+    """
+    def before_call():
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError("circuit open, skipping call")
+        if budget is not None:
+            budget.deposit()
+
+    def after_failure(func, retries, e):
+        # Returns the backoff to sleep, or re-raises if we should give up
+        if breaker is not None:
+            breaker.record_failure()
+        if retries >= max_retries or (budget is not None and not budget.withdraw()):
+            raise e
+        wait = backoff_delay(retries, backoff_factor, max_backoff, jitter)
+        logging.warning(f"Retry {retries}/{max_retries} of {func.__name__} after error: {e}. Waiting {wait:.2f} seconds")
+        return wait
+
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                retries = 0
+                while True:
+                    before_call()
+                    try:
+                        result = await func(*args, **kwargs)
+                    except exceptions as e:
+                        retries += 1
+                        await asyncio.sleep(after_failure(func, retries, e))
+                        continue
+                    except BaseException:
+                        # Includes cancellation: never leave a trial hanging
+                        if breaker is not None:
+                            breaker.abort()
+                        raise
+                    if breaker is not None:
+                        breaker.record_success()
+                    return result
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             retries = 0
-            while retries < max_retries:
+            while True:
+                before_call()
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
                 except exceptions as e:
                     retries += 1
-                    if retries >= max_retries:
-                        raise
-                    wait = backoff_factor * (2 ** (retries - 1))
-                    logging.warning(f"Retry {retries}/{max_retries} after error: {e}. Waiting {wait} seconds")
-                    time.sleep(wait)
+                    time.sleep(after_failure(func, retries, e))
+                    continue
+                except BaseException:
+                    if breaker is not None:
+                        breaker.abort()
+                    raise
+                if breaker is not None:
+                    breaker.record_success()
+                return result
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+if __name__ == "__main__":
+    # Concurrency check: 200 threads and 200 asyncio tasks share one
+    # 3000/min (50/s) limiter with a burst of 5 on two hosts.
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = {}
+    calls_lock = threading.Lock()
+
+    @rate_limited(3000, key=host_key, burst=5)
+    def fetch(url):
+        with calls_lock:
+            calls.setdefault(host_key(url), []).append(time.monotonic())
+
+    @rate_limited(3000, key=host_key, burst=5)
+    async def fetch_async(url):
+        with calls_lock:
+            calls.setdefault(host_key(url), []).append(time.monotonic())
+
+    urls = [f"https://host{i % 2}.example/item/{i}" for i in range(40)]
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=200) as pool:
+        list(pool.map(fetch, urls * 5))
+
+    async def run_async():
+        await asyncio.gather(*(fetch_async(url) for url in urls * 5))
+    asyncio.run(run_async())
+    elapsed = time.monotonic() - start
+
+    for host, stamps in sorted(calls.items()):
+        stamps.sort()
+        # Any 1s window may hold at most rate + burst calls
+        worst = max(sum(1 for t in stamps if s <= t < s + 1.0) for s in stamps)
+        print(f"{host}: {len(stamps)} calls, max {worst} in any 1s window (limit 55)")
+    print(f"finished in {elapsed:.1f}s")
+
+    # Breaker + budget: a dependency that always fails
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    @retry(max_retries=5, backoff_factor=0.01, breaker=breaker, budget=RetryBudget(initial=2))
+    def flaky():
+        raise RequestException("service down")
+
+    for attempt in range(3):
+        try:
+            flaky()
+        except (RequestException, CircuitOpenError) as e:
+            print(f"call {attempt}: {type(e).__name__} (breaker {breaker.state})")